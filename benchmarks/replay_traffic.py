@@ -0,0 +1,319 @@
+# benchmarks/replay_traffic.py
+"""
+Replay captured production traffic against a running instance.
+
+Reads a capture written with `capture_enabled = true` and sends its requests to `--base-url` with
+their original spacing divided by `--speed` (`max` sends them as fast as `--concurrency` allows),
+then prints per-route latency percentiles, errors and status codes that differ from the capture:
+
+    python -m benchmarks.replay_traffic captures/traffic.jsonl --speed 1
+    python -m benchmarks.replay_traffic captures/traffic.jsonl.gz --speed 10 --concurrency 32
+    python -m benchmarks.replay_traffic captures/traffic.jsonl --speed max --report report.json
+
+User IDs are remapped onto the target's users by rank, so the n-th smallest captured user ID becomes
+the n-th smallest target user ID, which is the identity on a restored copy of the captured database.
+Offers created during the capture are mapped to the offers their replayed create_offer requests
+create, and requests on them wait until that create has finished. Other offer IDs are sent as is.
+Pass `--keep-ids` to send every ID unchanged.
+
+Captured `Idempotency-Key` headers are sent again, prefixed with an ID unique to the replay run, so
+retries are deduplicated as they were in production without colliding with keys from earlier runs.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+
+import requests
+
+from middle_earth_trading_platform.Capture import read_capture
+
+# Request fields that hold user and offer IDs, in bodies, query strings and path parameters
+USER_FIELDS = ("user_id", "sender_id", "receiver_id")
+OFFER_FIELDS = ("offer_id",)
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) or (isinstance(value, str) and value.isdigit())
+
+
+def _json_body(record):
+    if "body" not in record or not record.get("type", "").startswith("application/json"):
+        return None
+    try:
+        return json.loads(record["body"])
+    except ValueError:
+        return None
+
+
+def _fields(record):
+    """Yield the (field, value) pairs of a record that may hold IDs."""
+    yield from record.get("params", {}).items()
+    yield from parse_qsl(record.get("query", ""))
+    body = _json_body(record)
+    if isinstance(body, dict):
+        yield from body.items()
+
+
+def _created_offer(record):
+    """Return the ID of the offer a captured create_offer request created, or None."""
+    if record.get("route") != "/offers/create_offer" or record["status"] != 200 or "response" not in record:
+        return None
+    try:
+        return json.loads(record["response"]).get("offer_id")
+    except ValueError:
+        return None
+
+
+class IdMap:
+    """Deterministic mapping of captured user and offer IDs to IDs that exist on the target."""
+
+    def __init__(self, records, target_user_ids, keep_ids: bool = False, wait_timeout: float = 30.0):
+        self.keep_ids = keep_ids
+        self.wait_timeout = wait_timeout
+
+        captured_user_ids = sorted({int(value) for record in records for field, value in _fields(record)
+                                    if field in USER_FIELDS and _is_int(value)})
+        target_user_ids = sorted(target_user_ids)
+        self.users = {}
+        if target_user_ids:
+            self.users = {user_id: target_user_ids[rank % len(target_user_ids)]
+                          for rank, user_id in enumerate(captured_user_ids)}
+
+        # captured offer ID -> replayed offer ID, set once its create_offer has been replayed
+        self._offers = {}
+        self._created = {}
+        for record in records:
+            offer_id = _created_offer(record)
+            if offer_id is not None:
+                self._created[offer_id] = threading.Event()
+
+    def user(self, user_id: int) -> int:
+        return user_id if self.keep_ids else self.users.get(user_id, user_id)
+
+    def offer(self, offer_id: int):
+        """Return the target offer ID, or None if the offer was created in the capture but not in the replay."""
+        if self.keep_ids or offer_id not in self._created:
+            return offer_id
+        self._created[offer_id].wait(self.wait_timeout)
+        return self._offers.get(offer_id)
+
+    def offer_created(self, record, response):
+        captured = _created_offer(record)
+        if captured is None:
+            return
+        try:
+            if response is not None and response.status_code == 200:
+                self._offers[captured] = response.json()["offer_id"]
+        except (ValueError, KeyError):
+            pass
+        finally:
+            self._created[captured].set()
+
+    def _map(self, field, value):
+        if not _is_int(value):
+            return value
+        if field in USER_FIELDS:
+            mapped = self.user(int(value))
+        elif field in OFFER_FIELDS:
+            mapped = self.offer(int(value))
+            if mapped is None:
+                raise LookupError(f"offer {value} was not created by the replay")
+        else:
+            return value
+        return mapped if isinstance(value, int) else str(mapped)
+
+    def request(self, record):
+        """Return the (method, path, body) to send for a captured request, with its IDs remapped."""
+        path = record["path"]
+        params = record.get("params")
+        if params and "route" in record:
+            path = record["route"].format(**{field: self._map(field, value) for field, value in params.items()})
+        if record.get("query"):
+            path += "?" + urlencode([(field, self._map(field, value)) for field, value in parse_qsl(record["query"])])
+
+        body = record.get("body")
+        json_body = _json_body(record)
+        if isinstance(json_body, dict):
+            body = json.dumps({field: self._map(field, value) for field, value in json_body.items()})
+        return record["method"], path, body
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.captured_latencies = []
+        self.errors = 0
+        self.status_mismatches = 0
+        self.statuses = {}
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        captured = sorted(self.captured_latencies)
+        return {
+            "requests": len(self.captured_latencies),
+            "errors": self.errors,
+            "status_mismatches": self.status_mismatches,
+            "statuses": dict(sorted(self.statuses.items())),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 3) if latencies else None,
+            "captured_p50_ms": _percentile(captured, 50),
+        }
+
+
+def _percentile(values, percentile: float):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * percentile / 100))], 3)
+
+
+class Replayer:
+    """Sends captured requests on a thread pool, keeping their relative timing scaled by `speed`."""
+
+    def __init__(self, base_url: str, id_map: IdMap, speed, concurrency: int, timeout: float = 30.0,
+                 run_id: str = None):
+        self.base_url = base_url.rstrip("/")
+        self.id_map = id_map
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self.routes = {}
+        self.max_lag = 0.0
+
+    def run(self, records):
+        started = time.perf_counter()
+        first_ts = records[0]["ts"] if records else 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for record in records:
+                if self.speed is not None:
+                    due = started + (record["ts"] - first_ts) / self.speed
+                    delay = due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                # Wait for a free worker, so a saturated target shows up as lag instead of a growing backlog
+                self._slots.acquire()
+                if self.speed is not None:
+                    self.max_lag = max(self.max_lag, time.perf_counter() - due)
+                pool.submit(self._send, record)
+        return time.perf_counter() - started
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def idempotency_key(self, key: str) -> str:
+        """Namespace a captured Idempotency-Key to this replay run, within the server's 255 character limit."""
+        replayed = f"replay-{self.run_id}-{key}"
+        if len(replayed) > 255:
+            replayed = f"replay-{self.run_id}-{hashlib.sha256(key.encode()).hexdigest()}"
+        return replayed
+
+    def _send(self, record):
+        response = None
+        started = time.perf_counter()
+        try:
+            method, path, body = self.id_map.request(record)
+            headers = {"Content-Type": record["type"]} if "type" in record else {}
+            if "idempotency_key" in record:
+                headers["Idempotency-Key"] = self.idempotency_key(record["idempotency_key"])
+            started = time.perf_counter()
+            response = self._session().request(method, self.base_url + path, data=body, headers=headers,
+                                               timeout=self.timeout)
+            status = response.status_code
+        except (requests.RequestException, LookupError) as error:
+            status = type(error).__name__
+        finally:
+            latency = (time.perf_counter() - started) * 1000
+            self.id_map.offer_created(record, response)
+            self._slots.release()
+
+        route = f"{record['method']} {record.get('route', record['path'])}"
+        with self._lock:
+            stats = self.routes.setdefault(route, RouteStats())
+            stats.captured_latencies.append(record["ms"])
+            stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+            if not isinstance(status, int) or status >= 500:
+                stats.errors += 1
+                return
+            stats.latencies.append(latency)
+            if status != record["status"]:
+                stats.status_mismatches += 1
+
+    def report(self, elapsed: float):
+        routes = {route: stats.report() for route, stats in sorted(self.routes.items())}
+        requests_sent = sum(route["requests"] for route in routes.values())
+        return {
+            "requests": requests_sent,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(requests_sent / elapsed, 1) if elapsed else None,
+            "max_lag_ms": round(self.max_lag * 1000, 3) if self.speed is not None else None,
+            "errors": sum(route["errors"] for route in routes.values()),
+            "status_mismatches": sum(route["status_mismatches"] for route in routes.values()),
+            "routes": routes,
+        }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['elapsed_s']}s ({report['throughput_rps']} req/s), "
+          f"{report['errors']} errors, {report['status_mismatches']} status mismatches"
+          + (f", max schedule lag {report['max_lag_ms']} ms" if report["max_lag_ms"] is not None else ""))
+    print(f"{'route':<45} {'reqs':>6} {'errors':>6} {'diff':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} "
+          f"{'capt p50':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<45} {stats['requests']:>6} {stats['errors']:>6} {stats['status_mismatches']:>5} "
+              + " ".join(f"{value if value is not None else '-':>8}" for value in
+                         (stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"], stats["captured_p50_ms"])))
+
+
+def target_user_ids(base_url: str):
+    response = requests.get(base_url.rstrip("/") + "/get_all_user_details", timeout=30)
+    response.raise_for_status()
+    return [user["id"] for user in response.json()]
+
+
+def parse_speed(value: str):
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="capture file, optionally gzip compressed")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="instance to replay against")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="time scale, e.g. 1, 10 or max")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--keep-ids", action="store_true", help="send user and offer IDs unchanged")
+    parser.add_argument("--report", help="also write the report as JSON to this file")
+    parser.add_argument("--run-id", help="prefix for replayed Idempotency-Key headers; random by default")
+    args = parser.parse_args()
+
+    records = sorted(read_capture(args.capture), key=lambda record: record["ts"])
+    id_map = IdMap(records, [] if args.keep_ids else target_user_ids(args.base_url), keep_ids=args.keep_ids)
+    replayer = Replayer(args.base_url, id_map, args.speed, args.concurrency, run_id=args.run_id)
+    report = replayer.report(replayer.run(records))
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
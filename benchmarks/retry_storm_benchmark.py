@@ -0,0 +1,121 @@
+# benchmarks/retry_storm_benchmark.py
+"""
+Database work saved by idempotency keys during a retry storm.
+
+Sends every create_offer and respond_to_offer request `--retries` extra times, once without and once
+with an `Idempotency-Key` header, and counts the SQL statements each run executes, how many of them
+touch the inventory table, and how many offers were created:
+
+    python -m benchmarks.retry_storm_benchmark --requests 200 --retries 4 --concurrency 8
+    python -m benchmarks.retry_storm_benchmark --database-url sqlite:///bench.db --create-schema
+"""
+import argparse
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from middle_earth_trading_platform.database import DBSession
+from middle_earth_trading_platform.database.Backends import create_schema, upsert_inventory, use_database
+from middle_earth_trading_platform.database.Schemas import User, Offers
+
+
+class StatementCounter:
+    """Counts the SQL statements executed while it is attached."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = 0
+        self.inventory_statements = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.statements += 1
+            if "inventory" in statement:
+                self.inventory_statements += 1
+
+
+def create_users():
+    run = uuid.uuid4().hex[:8]
+    session = DBSession.SessionLocal()
+    users = [User(username=f"retry_{run}_{i}", race="hobbit", created_at=datetime.now(), updated_at=datetime.now())
+             for i in range(2)]
+    session.add_all(users)
+    session.commit()
+    user_ids = [user.id for user in users]
+    upsert_inventory(session, [{"user_id": user_id, "weapon_name": weapon, "quantity": 10 ** 9}
+                               for user_id in user_ids for weapon in ("sword", "bow")])
+    session.commit()
+    session.close()
+    return user_ids
+
+
+def storm(client, requests, retries: int, concurrency: int, use_keys: bool):
+    """Send each (path, body) request 1 + `retries` times, concurrently, optionally with a shared key."""
+    def send(path, body, key):
+        headers = {"Idempotency-Key": key} if use_keys else {}
+        return client.post(path, json=body, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for path, body in requests:
+            key = uuid.uuid4().hex
+            futures.extend(pool.submit(send, path, body, key) for _ in range(retries + 1))
+        return [future.result() for future in futures]
+
+
+def run(client, args, use_keys: bool):
+    sender_id, receiver_id = create_users()
+    offer = {"user_id": sender_id, "receiver_id": receiver_id, "sender_items": {"bow": 1},
+             "receiver_items": {"sword": 1}}
+
+    counter = StatementCounter()
+    event.listen(Engine, "before_cursor_execute", counter)
+    started = time.perf_counter()
+    storm(client, [("/offers/create_offer", offer)] * args.requests, args.retries, args.concurrency, use_keys)
+
+    session = DBSession.SessionLocal()
+    offer_ids = [offer_id for offer_id, in session.query(Offers.offer_id).filter(
+        Offers.sender_id == sender_id).order_by(Offers.offer_id)]
+    session.close()
+    responses = [("/users/respond_to_offer", {"user_id": receiver_id, "offer_id": offer_id, "response": "accept"})
+                 for offer_id in offer_ids[:args.requests]]
+    storm(client, responses, args.retries, args.concurrency, use_keys)
+    elapsed = time.perf_counter() - started
+    event.remove(Engine, "before_cursor_execute", counter)
+
+    label = "with keys" if use_keys else "no keys"
+    print(f"{label:>9}: {counter.statements} statements, {counter.inventory_statements} touching inventory, "
+          f"{len(offer_ids)} offers created for {args.requests} logical requests, {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="logical requests per endpoint")
+    parser.add_argument("--retries", type=int, default=4, help="extra attempts per logical request")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--database-url", help="database to benchmark instead of the configured one")
+    parser.add_argument("--create-schema", action="store_true", help="create missing tables first")
+    args = parser.parse_args()
+
+    if args.database_url:
+        use_database(args.database_url)
+    if args.create_schema:
+        create_schema()
+    print(f"backend: {DBSession.engine.dialect.name}")
+
+    # Imported after the database is chosen so the app's settlement queue binds to it
+    from middle_earth_trading_platform.main import app
+
+    with TestClient(app) as client:
+        run(client, args, use_keys=False)
+        run(client, args, use_keys=True)
+
+
+if __name__ == "__main__":
+    main()
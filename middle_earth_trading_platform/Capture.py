@@ -0,0 +1,167 @@
+# Capture.py
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+from middle_earth_trading_platform.Configuration import capture_max_body_bytes
+
+# Paths that are never captured, so a replay does not toggle profiling or capture on the target
+_EXCLUDED_PREFIXES = ("/admin", "/docs", "/redoc", "/openapi.json")
+
+
+class TrafficCapture:
+    """
+    Records the requests served by the app to an append-only JSON lines file for later replay.
+
+    Each line holds the start time, method, path, query string, matched route template and path
+    parameters, request body, `Idempotency-Key` header, response status and latency of one request.
+    Bodies up to `max_body_bytes` are kept, for responses too so the replay can map the IDs the
+    server allocated.
+    Lines are written by a background thread, so the request path only builds a dict and queues it.
+    A path ending in `.gz` is written gzip compressed.
+    """
+
+    def __init__(self, max_body_bytes: int = capture_max_body_bytes):
+        self.enabled = False
+        self.path = None
+        self.max_body_bytes = max_body_bytes
+
+        self._records = queue.SimpleQueue()
+        self._writer = None
+
+    def start(self, path: str):
+        """Start appending the served requests to `path`."""
+        if self.enabled:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._writer = threading.Thread(target=self._write_forever, args=(path,), name="traffic-capture",
+                                        daemon=True)
+        self._writer.start()
+        self.enabled = True
+
+    def stop(self):
+        """Stop capturing and wait until the queued records are written."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._records.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def record(self, record: dict):
+        self._records.put(record)
+
+    def _write_forever(self, path: str):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "at", encoding="utf-8") as capture_file:
+            while True:
+                record = self._records.get()
+                # Write everything queued so far before flushing
+                while record is not None:
+                    capture_file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                    try:
+                        record = self._records.get_nowait()
+                    except queue.Empty:
+                        break
+                capture_file.flush()
+                if record is None:
+                    return
+
+
+def _body_text(chunks, size: int, limit: int):
+    if not chunks or size > limit:
+        return None
+    try:
+        return b"".join(chunks).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class CaptureMiddleware:
+    """ASGI middleware that hands every served HTTP request to the traffic capture while it is enabled."""
+
+    def __init__(self, app, capture: TrafficCapture):
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope, receive, send):
+        if not self.capture.enabled or scope["type"] != "http" or scope["path"].startswith(_EXCLUDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.capture.max_body_bytes
+        request_chunks, response_chunks = [], []
+        sizes = {"request": 0, "response": 0}
+        response = {"status": None, "type": None}
+
+        async def capture_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                sizes["request"] += len(body)
+                if sizes["request"] <= limit:
+                    request_chunks.append(body)
+            return message
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type":
+                        response["type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                sizes["response"] += len(body)
+                if sizes["response"] <= limit:
+                    response_chunks.append(body)
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, capture_receive, capture_send)
+        finally:
+            duration = time.perf_counter() - started
+            record = {"ts": round(started_at, 6), "method": scope["method"], "path": scope["path"]}
+            if scope.get("query_string"):
+                record["query"] = scope["query_string"].decode("latin-1")
+            # The router stores the matched route and its parameters in the scope
+            route = scope.get("route")
+            if route is not None:
+                record["route"] = route.path
+            if scope.get("path_params"):
+                record["params"] = scope["path_params"]
+            for name, value in scope.get("headers", ()):
+                if name == b"content-type":
+                    record["type"] = value.decode("latin-1")
+                elif name == b"idempotency-key":
+                    # Kept so a replay deduplicates client retries the way the server did
+                    record["idempotency_key"] = value.decode("latin-1")
+            body = _body_text(request_chunks, sizes["request"], limit)
+            if body is not None:
+                record["body"] = body
+            record["status"] = response["status"] or 500
+            record["ms"] = round(duration * 1000, 3)
+            if response["type"] and response["type"].startswith("application/json"):
+                body = _body_text(response_chunks, sizes["response"], limit)
+                if body is not None:
+                    record["response"] = body
+            self.capture.record(record)
+
+
+def read_capture(path: str):
+    """Yield the records of a capture file in the order they were written."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as capture_file:
+        for line in capture_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+traffic_capture = TrafficCapture()
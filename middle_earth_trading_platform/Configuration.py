@@ -32,3 +32,85 @@ if mysql_schema is None:
 db_name = os.environ.get('db_name')
 if db_name is None:
     db_name = config.get('ENVIRONMENT', 'db_name', fallback='mysql')
+
+# A full SQLAlchemy URL (mysql://, postgresql://, sqlite:///...); takes precedence over the mysql_* keys
+database_url = os.environ.get('database_url')
+if database_url is None:
+    database_url = config.get('ENVIRONMENT', 'database_url', fallback='')
+
+settlement_mode = os.environ.get('settlement_mode')
+if settlement_mode is None:
+    settlement_mode = config.get('ENVIRONMENT', 'settlement_mode', fallback='inline')
+
+settlement_workers = os.environ.get('settlement_workers')
+if settlement_workers is None:
+    settlement_workers = config.get('ENVIRONMENT', 'settlement_workers', fallback='4')
+settlement_workers = int(settlement_workers)
+
+profiling_enabled = os.environ.get('profiling_enabled')
+if profiling_enabled is None:
+    profiling_enabled = config.get('ENVIRONMENT', 'profiling_enabled', fallback='false')
+profiling_enabled = profiling_enabled.lower() in ('1', 'true', 'yes')
+
+# Comma separated route names (e.g. respond_to_offer) or paths; empty profiles every route
+profiling_routes = os.environ.get('profiling_routes')
+if profiling_routes is None:
+    profiling_routes = config.get('ENVIRONMENT', 'profiling_routes', fallback='')
+profiling_routes = [route.strip() for route in profiling_routes.split(',') if route.strip()]
+
+profiling_sample_rate = os.environ.get('profiling_sample_rate')
+if profiling_sample_rate is None:
+    profiling_sample_rate = config.get('ENVIRONMENT', 'profiling_sample_rate', fallback='1.0')
+profiling_sample_rate = float(profiling_sample_rate)
+
+profiling_interval_ms = os.environ.get('profiling_interval_ms')
+if profiling_interval_ms is None:
+    profiling_interval_ms = config.get('ENVIRONMENT', 'profiling_interval_ms', fallback='5')
+profiling_interval_ms = float(profiling_interval_ms)
+
+idempotency_ttl_seconds = os.environ.get('idempotency_ttl_seconds')
+if idempotency_ttl_seconds is None:
+    idempotency_ttl_seconds = config.get('ENVIRONMENT', 'idempotency_ttl_seconds', fallback='86400')
+idempotency_ttl_seconds = int(idempotency_ttl_seconds)
+
+idempotency_cache_size = os.environ.get('idempotency_cache_size')
+if idempotency_cache_size is None:
+    idempotency_cache_size = config.get('ENVIRONMENT', 'idempotency_cache_size', fallback='10000')
+idempotency_cache_size = int(idempotency_cache_size)
+
+# Serve /items/{weapon_name}/holders from memory; only correct when a single process settles offers
+holders_cache = os.environ.get('holders_cache')
+if holders_cache is None:
+    holders_cache = config.get('ENVIRONMENT', 'holders_cache', fallback='false')
+holders_cache = holders_cache.lower() in ('1', 'true', 'yes')
+
+# Record served requests to capture_path (JSON lines, gzip when it ends in .gz) for benchmarks/replay_traffic.py
+capture_enabled = os.environ.get('capture_enabled')
+if capture_enabled is None:
+    capture_enabled = config.get('ENVIRONMENT', 'capture_enabled', fallback='false')
+capture_enabled = capture_enabled.lower() in ('1', 'true', 'yes')
+
+capture_path = os.environ.get('capture_path')
+if capture_path is None:
+    capture_path = config.get('ENVIRONMENT', 'capture_path', fallback='captures/traffic.jsonl')
+
+capture_max_body_bytes = os.environ.get('capture_max_body_bytes')
+if capture_max_body_bytes is None:
+    capture_max_body_bytes = config.get('ENVIRONMENT', 'capture_max_body_bytes', fallback='4096')
+capture_max_body_bytes = int(capture_max_body_bytes)
+
+# How long /changes keeps changes; mirrors further behind than this must re-sync from the full listings
+change_retention_seconds = os.environ.get('change_retention_seconds')
+if change_retention_seconds is None:
+    change_retention_seconds = config.get('ENVIRONMENT', 'change_retention_seconds', fallback='604800')
+change_retention_seconds = int(change_retention_seconds)
+
+# Expose the /admin routes (runtime profiling); when admin_token is set they also need a matching X-Admin-Token header
+admin_enabled = os.environ.get('admin_enabled')
+if admin_enabled is None:
+    admin_enabled = config.get('ENVIRONMENT', 'admin_enabled', fallback='false')
+admin_enabled = admin_enabled.lower() in ('1', 'true', 'yes')
+
+admin_token = os.environ.get('admin_token')
+if admin_token is None:
+    admin_token = config.get('ENVIRONMENT', 'admin_token', fallback='')
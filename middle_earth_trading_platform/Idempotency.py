@@ -0,0 +1,197 @@
+# Idempotency.py
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+
+from middle_earth_trading_platform.Configuration import idempotency_ttl_seconds, idempotency_cache_size
+from middle_earth_trading_platform.database.Backends import begin_write
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import IdempotencyKey
+
+StoredResponse = namedtuple("StoredResponse", ["request_hash", "status_code", "body"])
+
+
+class IdempotencyStore:
+    """
+    Deduplicates retried requests that carry an `Idempotency-Key` header.
+
+    The first request with a key runs its handler; successful responses are kept in a bounded
+    in-process LRU cache and in the `idempotency_keys` table, and repeats of the key get the stored
+    response back without running the handler again. Concurrent duplicates in this process wait for
+    the first execution instead of starting their own, and duplicates arriving at another process
+    while the first is still running get a 409. Error responses are not stored, so a request that
+    failed can be retried with the same key. Every `prune_every` stored responses, responses older
+    than the TTL are deleted from the table.
+    """
+
+    def __init__(self, ttl_seconds: int = idempotency_ttl_seconds, max_entries: int = idempotency_cache_size,
+                 reservation_timeout: int = 60, prune_every: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.reservation_timeout = reservation_timeout
+        self.prune_every = prune_every
+
+        # Responses stored since the table was last pruned
+        self._saves = 0
+
+        # (endpoint, key) -> (expires_at, StoredResponse)
+        self._cache = OrderedDict()
+        # (endpoint, key) -> Future resolved with the StoredResponse of the running request
+        self._in_flight = {}
+
+    async def run(self, key, endpoint: str, payload, handler):
+        """
+        Run `handler` once per idempotency key and return its response, or replay the stored one.
+
+        Parameters:
+        - key (str): The `Idempotency-Key` header value; the handler always runs when it is None.
+        - endpoint (str): Name of the endpoint the key is scoped to.
+        - payload: The JSON-serialisable request body, used to reject a key reused for another request.
+        - handler: A coroutine function producing the JSONResponse.
+        """
+        if key is None:
+            return await handler()
+        if len(key) > 255:
+            return JSONResponse(status_code=400, content={"error": "Idempotency-Key must be at most 255 characters"})
+
+        request_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        cache_key = (endpoint, key)
+
+        stored = self._cached(cache_key)
+        if stored is None and cache_key in self._in_flight:
+            stored = await asyncio.shield(self._in_flight[cache_key])
+        if stored is None:
+            stored, reserved = self._reserve(key, endpoint, request_hash)
+            if stored is None and not reserved:
+                return JSONResponse(status_code=409, content={"error": "A request with this Idempotency-Key "
+                                                                       "is already in progress"})
+        if stored is not None:
+            return self._replay(stored, request_hash)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cache_key] = future
+        stored = None
+        try:
+            response = await handler()
+            stored = StoredResponse(request_hash, response.status_code, json.loads(response.body))
+            if 200 <= response.status_code < 300:
+                self._save(key, endpoint, stored)
+            else:
+                self._release(key, endpoint)
+            return response
+        except BaseException:
+            self._release(key, endpoint)
+            raise
+        finally:
+            del self._in_flight[cache_key]
+            # Duplicates waiting on this request get its response, or run the handler themselves if it failed
+            future.set_result(stored)
+
+    def _replay(self, stored: StoredResponse, request_hash: str):
+        if stored.request_hash != request_hash:
+            return JSONResponse(status_code=422, content={"error": "Idempotency-Key was already used with a "
+                                                                   "different request"})
+        return JSONResponse(status_code=stored.status_code, content=stored.body,
+                            headers={"Idempotent-Replayed": "true"})
+
+    def _cached(self, cache_key):
+        entry = self._cache.get(cache_key)
+        if entry is None:
+            return None
+        expires_at, stored = entry
+        if expires_at < time.monotonic():
+            del self._cache[cache_key]
+            return None
+        self._cache.move_to_end(cache_key)
+        return stored
+
+    def _remember(self, cache_key, stored: StoredResponse, age: float = 0.0):
+        self._cache[cache_key] = (time.monotonic() + self.ttl_seconds - age, stored)
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _reserve(self, key: str, endpoint: str, request_hash: str):
+        """
+        Look the key up in the database and reserve it if nobody holds it.
+
+        Returns (stored response, False) for a completed key, (None, True) when the reservation was
+        taken, and (None, False) when another request is still working on the key.
+        """
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            now = datetime.now()
+            record = session.get(IdempotencyKey, (key, endpoint))
+            if record is not None:
+                age = (now - record.created_at).total_seconds()
+                if record.status_code is not None and age < self.ttl_seconds:
+                    stored = StoredResponse(record.request_hash, record.status_code, record.response)
+                    self._remember((endpoint, key), stored, age)
+                    return stored, False
+                if record.status_code is None and age < self.reservation_timeout:
+                    return None, False
+                # Expired response or abandoned reservation
+                session.delete(record)
+                session.flush()
+
+            session.add(IdempotencyKey(key=key, endpoint=endpoint, request_hash=request_hash, created_at=now))
+            session.commit()
+            return None, True
+        except IntegrityError:
+            # Another process reserved the key between our lookup and insert
+            session.rollback()
+            return None, False
+        finally:
+            session.close()
+
+    def _save(self, key: str, endpoint: str, stored: StoredResponse):
+        self._remember((endpoint, key), stored)
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            session.query(IdempotencyKey).filter(
+                (IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint)).update(
+                {IdempotencyKey.status_code: stored.status_code,
+                 IdempotencyKey.response: stored.body,
+                 IdempotencyKey.created_at: datetime.now()}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+        self._saves += 1
+        if self._saves >= self.prune_every:
+            self._saves = 0
+            self.prune()
+
+    def _release(self, key: str, endpoint: str):
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            session.query(IdempotencyKey).filter(
+                (IdempotencyKey.key == key) & (IdempotencyKey.endpoint == endpoint) &
+                IdempotencyKey.status_code.is_(None)).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def prune(self):
+        """Delete stored responses older than the TTL from the database."""
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            session.query(IdempotencyKey).filter(
+                IdempotencyKey.created_at < datetime.now() - timedelta(seconds=self.ttl_seconds)).delete(
+                synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,369 @@
+# Profiling.py
+import marshal
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.routing import Match
+
+from middle_earth_trading_platform.Configuration import (profiling_enabled, profiling_routes, profiling_sample_rate,
+                                                         profiling_interval_ms)
+
+# The profile of the request being handled in the current context, or None when it is not profiled
+_current_request = ContextVar("current_request", default=None)
+
+_NO_SPAN = nullcontext()
+
+
+class RequestProfile:
+    """Timings collected for one profiled request."""
+
+    def __init__(self, route: str, frame_id: int = None):
+        self.route = route
+        # id() of the middleware frame handling the request, while it is being handled
+        self.frame_id = frame_id
+        self.started_at = time.time()
+        self.duration = 0.0
+        # span name -> [count, total seconds]
+        self.spans = {}
+
+    def add(self, name: str, seconds: float):
+        totals = self.spans.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+
+    def to_dict(self):
+        return {
+            "route": self.route,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": {name: {"count": count, "total_ms": round(total * 1000, 3)}
+                      for name, (count, total) in self.spans.items()},
+        }
+
+
+class _Span:
+    __slots__ = ("profile", "name", "started")
+
+    def __init__(self, profile: RequestProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profile.add(self.name, time.perf_counter() - self.started)
+
+
+def span(name: str):
+    """
+    Time a block of code as a span of the current request.
+
+    Returns a shared no-op context manager when the request is not being profiled.
+    """
+    profile = _current_request.get()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name)
+
+
+class Profiler:
+    """
+    Sampling profiler for the request handlers.
+
+    While enabled, a daemon thread samples the Python stack of every thread that is handling a
+    profiled request every `interval_ms` milliseconds. A thread is only sampled while a profiled
+    request's coroutine is running on it, so other requests and the idle event loop on the same
+    thread are left out, and each sample is cut at the request's middleware frame and rooted at its
+    route name. Samples are aggregated into collapsed stacks (the input format of flamegraph.pl and
+    speedscope) and can be exported as a pstats file.
+    Profiled requests also record spans for session acquisition, query execution, serialization
+    and commit. Requests are profiled if their route name or path is in `routes` (all routes when
+    empty), for a `sample_rate` fraction of them.
+    """
+
+    def __init__(self, max_requests: int = 500):
+        self.enabled = False
+        self.routes = set()
+        self.sample_rate = 1.0
+        self.interval = 0.005
+
+        self._lock = threading.Lock()
+        # id() of the middleware frame of each profiled request being handled -> (thread id, route)
+        self._active_frames = {}
+        # (route, stack) -> number of samples
+        self._stacks = Counter()
+        self._requests = deque(maxlen=max_requests)
+        self._sampler = None
+        self._stopping = threading.Event()
+        self._endpoints = None
+
+    def configure(self, enabled: bool, routes=(), sample_rate: float = 1.0, interval_ms: float = 5.0):
+        """Switch profiling on or off and choose which requests are profiled."""
+        self.routes = set(routes)
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        if enabled and not self.enabled:
+            _listen_database_events()
+            self._stopping.clear()
+            self._sampler = threading.Thread(target=self._sample_forever, name="profiling-sampler", daemon=True)
+            self._sampler.start()
+        elif not enabled and self.enabled:
+            _remove_database_events()
+            self._stopping.set()
+            self._sampler.join()
+            self._sampler = None
+        self.enabled = enabled
+
+    def reset(self):
+        """Discard the samples and request timings collected so far."""
+        with self._lock:
+            self._stacks.clear()
+            self._requests.clear()
+
+    def settings(self):
+        return {
+            "enabled": self.enabled,
+            "routes": sorted(self.routes),
+            "sample_rate": self.sample_rate,
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self._stacks.values()),
+            "requests": len(self._requests),
+        }
+
+    def route_for(self, app, scope):
+        """Return the route name of a request if it should be profiled, otherwise None."""
+        if self._endpoints is None:
+            self._endpoints = _endpoint_routes(app.router.routes)
+        route = _matching_route(self._endpoints, scope)
+        if route is None:
+            return None
+        name = getattr(route, "name", None)
+        if self.routes and name not in self.routes and getattr(route, "path", None) not in self.routes:
+            return None
+        if random.random() >= self.sample_rate:
+            return None
+        return name
+
+    def start_request(self, route: str, frame) -> RequestProfile:
+        """Start profiling a request handled by `frame`; the stacks sampled below that frame are its samples."""
+        profile = RequestProfile(route, id(frame))
+        with self._lock:
+            self._active_frames[profile.frame_id] = (threading.get_ident(), route)
+        return profile
+
+    def finish_request(self, profile: RequestProfile, duration: float):
+        profile.duration = duration
+        with self._lock:
+            self._active_frames.pop(profile.frame_id, None)
+            profile.frame_id = None
+            self._requests.append(profile)
+
+    def collapsed(self) -> str:
+        """Return the samples as collapsed stacks, one `route;frame;frame count` line per stack."""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        return "".join(f"{';'.join([route] + [_frame_label(frame) for frame in stack])} {count}\n"
+                       for (route, stack), count in sorted(stacks))
+
+    def pstats(self) -> bytes:
+        """
+        Return the samples as a marshalled pstats dictionary, loadable with `pstats.Stats(path)`.
+
+        Call counts are sample counts and times are samples multiplied by the sampling interval. Each
+        route is the root caller of its samples, as a `<route>:0(name)` function.
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+
+        self_samples = Counter()
+        total_samples = Counter()
+        edges = Counter()
+        for (route, stack), count in stacks:
+            stack = (("<route>", 0, route),) + stack
+            self_samples[stack[-1]] += count
+            for frame in set(stack):
+                total_samples[frame] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges[(caller, callee)] += count
+
+        callers = {}
+        for (caller, callee), count in edges.items():
+            callers.setdefault(callee, {})[caller] = (count, count, 0.0, count * self.interval)
+
+        stats = {frame: (total, total, self_samples[frame] * self.interval, total * self.interval,
+                         callers.get(frame, {}))
+                 for frame, total in total_samples.items()}
+        return marshal.dumps(stats)
+
+    def request_timings(self):
+        """Return the recent profiled requests and their spans, with per-route averages."""
+        with self._lock:
+            requests = [profile.to_dict() for profile in self._requests]
+
+        routes = {}
+        for request in requests:
+            route = routes.setdefault(request["route"], {"requests": 0, "duration_ms": 0.0, "spans": {}})
+            route["requests"] += 1
+            route["duration_ms"] += request["duration_ms"]
+            for name, totals in request["spans"].items():
+                route["spans"][name] = route["spans"].get(name, 0.0) + totals["total_ms"]
+        for route in routes.values():
+            route["duration_ms"] = round(route["duration_ms"] / route["requests"], 3)
+            route["spans"] = {name: round(total / route["requests"], 3) for name, total in route["spans"].items()}
+
+        return {"routes": routes, "requests": requests}
+
+    def sample(self):
+        """Record the stack of every thread that is running a profiled request's code right now."""
+        with self._lock:
+            active = dict(self._active_frames)
+        if not active:
+            return
+        frames = sys._current_frames()
+        samples = []
+        for thread_id in {thread_id for thread_id, _ in active.values()}:
+            frame = frames.get(thread_id)
+            stack = []
+            # A suspended request's frames are not on the thread's stack, so a thread that is idle or
+            # running another request never reaches a profiled middleware frame
+            while frame is not None and id(frame) not in active:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if frame is not None:
+                samples.append((active[id(frame)][1], tuple(reversed(stack))))
+        del frames
+        with self._lock:
+            self._stacks.update(samples)
+
+    def _sample_forever(self):
+        while not self._stopping.wait(self.interval):
+            self.sample()
+
+
+def _endpoint_routes(routes):
+    """Flatten a route list into the routes that have an endpoint."""
+    endpoints = []
+    for route in routes:
+        if hasattr(route, "endpoint"):
+            endpoints.append(route)
+            continue
+        # Newer FastAPI versions keep included routers nested instead of copying their routes
+        children = getattr(route, "routes", None) or getattr(getattr(route, "original_router", None), "routes", None)
+        if children:
+            endpoints.extend(_endpoint_routes(children))
+    return endpoints
+
+
+def _matching_route(routes, scope):
+    for route in routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route
+    return None
+
+
+def _frame_label(frame) -> str:
+    filename, _, function = frame
+    module = filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    return f"{module}:{function}"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles the requests selected by the profiler."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self.profiler.route_for(scope["app"], scope)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start_request(route, sys._getframe())
+        token = _current_request.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_request.reset(token)
+            self.profiler.finish_request(profile, time.perf_counter() - started)
+
+
+# SQLAlchemy events behind the session acquisition, query execution and commit spans. They are
+# only registered while profiling is enabled.
+
+def _after_transaction_create(session, transaction):
+    if transaction.parent is None and _current_request.get() is not None:
+        session.info["profiling_acquire_started"] = time.perf_counter()
+
+
+def _after_begin(session, transaction, connection):
+    started = session.info.pop("profiling_acquire_started", None)
+    profile = _current_request.get()
+    if started is not None and profile is not None:
+        profile.add("session", time.perf_counter() - started)
+
+
+def _before_commit(session):
+    if _current_request.get() is not None:
+        session.info["profiling_commit_started"] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop("profiling_commit_started", None)
+    profile = _current_request.get()
+    if started is not None and profile is not None:
+        profile.add("commit", time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        conn.info.setdefault("profiling_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("profiling_query_started")
+    profile = _current_request.get()
+    if started and profile is not None:
+        profile.add("query", time.perf_counter() - started.pop())
+
+
+_DATABASE_EVENTS = [
+    (Session, "after_transaction_create", _after_transaction_create),
+    (Session, "after_begin", _after_begin),
+    (Session, "before_commit", _before_commit),
+    (Session, "after_commit", _after_commit),
+    (Engine, "before_cursor_execute", _before_cursor_execute),
+    (Engine, "after_cursor_execute", _after_cursor_execute),
+]
+
+
+def _listen_database_events():
+    for target, name, listener in _DATABASE_EVENTS:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+
+
+def _remove_database_events():
+    for target, name, listener in _DATABASE_EVENTS:
+        if event.contains(target, name, listener):
+            event.remove(target, name, listener)
+
+
+profiler = Profiler()
+profiler.configure(profiling_enabled, profiling_routes, profiling_sample_rate, profiling_interval_ms)
@@ -1,8 +1,10 @@
 # data/sample_data.py
 from datetime import datetime
 
+from middle_earth_trading_platform.database.Backends import upsert_inventory
 from middle_earth_trading_platform.database.DBSession import SessionLocal
-from middle_earth_trading_platform.database.Schemas import User, Inventory, Offers
+from middle_earth_trading_platform.database.Schemas import User, Offers
+from middle_earth_trading_platform.database.Summary import rebuild_user_summaries
 
 
 def create_dummy_data():
@@ -26,15 +28,15 @@ def create_dummy_data():
     user_ids = [user.id for user in users]
     # Create dummy inventory items
     inventory_items = [
-        Inventory(user_id=user_ids[0], weapon_name="staff", quantity=5),
-        Inventory(user_id=user_ids[0], weapon_name="axe", quantity=5),
-        Inventory(user_id=user_ids[0], weapon_name="bow", quantity=5),
-        Inventory(user_id=user_ids[1], weapon_name="bow", quantity=5),
-        Inventory(user_id=user_ids[1], weapon_name="axe", quantity=5),
-        Inventory(user_id=user_ids[1], weapon_name="sword", quantity=5),
-        Inventory(user_id=user_ids[2], weapon_name="staff", quantity=10)
+        {"user_id": user_ids[0], "weapon_name": "staff", "quantity": 5},
+        {"user_id": user_ids[0], "weapon_name": "axe", "quantity": 5},
+        {"user_id": user_ids[0], "weapon_name": "bow", "quantity": 5},
+        {"user_id": user_ids[1], "weapon_name": "bow", "quantity": 5},
+        {"user_id": user_ids[1], "weapon_name": "axe", "quantity": 5},
+        {"user_id": user_ids[1], "weapon_name": "sword", "quantity": 5},
+        {"user_id": user_ids[2], "weapon_name": "staff", "quantity": 10}
     ]
-    session.add_all(inventory_items)
+    upsert_inventory(session, inventory_items)
     session.commit()
 
     offer = Offers(sender_id=user_ids[0], receiver_id=user_ids[1], sender_items={"staff": 2},
@@ -44,5 +46,7 @@ def create_dummy_data():
     session.commit()
     session.close()
 
+    rebuild_user_summaries()
+
 
 create_dummy_data()
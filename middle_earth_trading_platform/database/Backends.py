@@ -0,0 +1,133 @@
+# database/Backends.py
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.engine import make_url
+
+# Pragmas applied to every SQLite connection. WAL lets readers run alongside the single writer and
+# synchronous=NORMAL is durable in WAL mode except for the last transactions before a power loss.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": "5000",
+    "cache_size": "-65536",
+    "temp_store": "MEMORY",
+    "mmap_size": "268435456",
+}
+
+
+def create_backend_engine(url: str):
+    """
+    Create an engine for a database URL with settings suited to its backend.
+
+    Supported backends are MySQL (`mysql://`, `mysql+pymysql://`, ...), PostgreSQL (`postgresql://`,
+    `postgresql+psycopg2://`, ...) and SQLite (`sqlite:///path/to/market.db`).
+    """
+    backend = make_url(url).get_backend_name()
+
+    if backend == "sqlite":
+        engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _configure_sqlite(dbapi_connection, connection_record):
+            # Let SQLAlchemy emit BEGIN itself so SAVEPOINTs work with the pysqlite driver
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            for pragma, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def _begin_sqlite(connection):
+            connection.exec_driver_sql(f"BEGIN {connection.get_execution_options().get('sqlite_begin', '')}")
+
+        return engine
+
+    if backend in ("mysql", "mariadb"):
+        return create_engine(url, pool_pre_ping=True, pool_recycle=3600)
+
+    return create_engine(url, pool_pre_ping=True)
+
+
+def begin_write(session):
+    """
+    Start the session's transaction as a write transaction.
+
+    Must be called before the session runs its first statement. On SQLite this issues
+    `BEGIN IMMEDIATE`, so the transaction waits for the write lock up front instead of failing with
+    "database is locked" when it upgrades from reading to writing; other backends are unaffected.
+    """
+    session.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+
+
+def upsert_inventory(session, rows):
+    """
+    Add quantities to inventory rows, creating the rows that do not exist yet.
+
+    Uses a single `INSERT ... ON DUPLICATE KEY UPDATE` on MySQL and `INSERT ... ON CONFLICT DO UPDATE`
+    on PostgreSQL and SQLite, keyed on the (user_id, weapon_name) unique constraint. Other backends
+    fall back to reading and updating the rows one by one.
+
+    Parameters:
+    - session (Session): The session the statement runs in; the caller commits.
+    - rows (List[Dict]): Dictionaries with `user_id`, `weapon_name` and the `quantity` to add.
+    """
+    # Imported here because Schemas imports DBSession, which imports this module
+    from middle_earth_trading_platform.database.Schemas import Inventory
+
+    if not rows:
+        return
+
+    backend = session.get_bind().dialect.name
+    if backend in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(Inventory).values(rows)
+        statement = statement.on_duplicate_key_update(quantity=Inventory.quantity + statement.inserted.quantity)
+    elif backend in ("postgresql", "sqlite"):
+        if backend == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(Inventory).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Inventory.user_id, Inventory.weapon_name],
+            set_={"quantity": Inventory.quantity + statement.excluded.quantity})
+    else:
+        for row in rows:
+            inventory = session.query(Inventory).filter(
+                (Inventory.user_id == row["user_id"]) & (Inventory.weapon_name == row["weapon_name"])).first()
+            if inventory:
+                inventory.quantity = inventory.quantity + row["quantity"]
+            else:
+                session.add(Inventory(**row))
+        session.flush()
+        return
+
+    session.execute(statement)
+
+
+def use_database(url: str):
+    """Point `SessionLocal` at another database, e.g. to run a benchmark against a different backend."""
+    from middle_earth_trading_platform.database import DBSession
+
+    DBSession.engine = create_backend_engine(url)
+    DBSession.SessionLocal.configure(bind=DBSession.engine)
+    return DBSession.engine
+
+
+def create_schema(engine=None):
+    """Create every table defined in `Schemas.py` that does not exist yet, and their single-row tables' rows."""
+    from middle_earth_trading_platform.database import DBSession, Schemas
+
+    engine = engine or DBSession.engine
+    DBSession.Base.metadata.create_all(engine)
+
+    # Created up front so concurrent processes only ever update them
+    rows = [(Schemas.ChangeSequence, {"last_seq": 0, "pruned_through": 0}), (Schemas.SettlementLease, {})]
+    with engine.begin() as connection:
+        for table, values in rows:
+            if connection.execute(select(table.id).where(table.id == 1)).first() is None:
+                connection.execute(insert(table).values(id=1, **values))
+
+
+if __name__ == "__main__":
+    create_schema()
@@ -0,0 +1,97 @@
+# database/Changes.py
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from middle_earth_trading_platform.Configuration import change_retention_seconds
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import ChangeLog, ChangeSequence
+
+# Retention runs whenever the sequence crosses a multiple of this, in the transaction that crosses it
+PRUNE_EVERY = 1000
+
+
+def record_offer_change(session, offer):
+    """Add an offer to the change log, as it is when the session commits."""
+    session.info.setdefault("changed_offers", {})[offer.offer_id] = offer
+
+
+def record_inventory_changes(session, changes):
+    """Add (user_id, weapon_name, new quantity) inventory changes to the change log when the session commits."""
+    changed = session.info.setdefault("changed_inventory", {})
+    for user_id, weapon_name, quantity in changes:
+        changed[(user_id, weapon_name)] = quantity
+
+
+def _allocate(session, count: int) -> int:
+    """
+    Reserve `count` sequence numbers and return the last one.
+
+    The UPDATE locks the counter row until the transaction ends, so transactions get their numbers
+    in the order they commit and a reader never sees a number appear behind one it already read.
+    """
+    statement = update(ChangeSequence).where(ChangeSequence.id == 1).values(
+        last_seq=ChangeSequence.last_seq + count)
+    if session.get_bind().dialect.update_returning:
+        last_seq = session.execute(statement.returning(ChangeSequence.last_seq)).scalar()
+    elif session.execute(statement).rowcount:
+        last_seq = session.query(ChangeSequence.last_seq).filter(ChangeSequence.id == 1).scalar()
+    else:
+        last_seq = None
+    if last_seq is None:
+        # create_schema creates the row; this only runs on databases set up without it
+        try:
+            with session.begin_nested():
+                session.execute(insert(ChangeSequence).values(id=1, last_seq=count, pruned_through=0))
+            return count
+        except IntegrityError:
+            # Another transaction created the row first
+            return _allocate(session, count)
+    return last_seq
+
+
+def prune_changes(session, retention_seconds: int = change_retention_seconds):
+    """Delete the changes older than the retention period and remember the last deleted sequence number."""
+    cutoff = datetime.now() - timedelta(seconds=retention_seconds)
+    pruned_through = session.query(func.max(ChangeLog.seq)).filter(ChangeLog.created_at < cutoff).scalar()
+    if pruned_through is None:
+        return
+    session.query(ChangeLog).filter(ChangeLog.seq <= pruned_through).delete(synchronize_session=False)
+    session.query(ChangeSequence).filter(ChangeSequence.id == 1).update(
+        {ChangeSequence.pruned_through: pruned_through}, synchronize_session=False)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _write_change_log(session):
+    # Also fired when a savepoint commits; only the outermost commit writes the log and takes the counter lock
+    if session.in_nested_transaction():
+        return
+    offers = session.info.pop("changed_offers", None) or {}
+    inventory = session.info.pop("changed_inventory", None) or {}
+    if not offers and not inventory:
+        return
+
+    session.flush()
+    now = datetime.now()
+    rows = [{"entity": "offers", "entity_key": str(offer_id), "data": offers[offer_id].to_dict(), "created_at": now}
+            for offer_id in sorted(offers)]
+    rows.extend({"entity": "inventory", "entity_key": f"{user_id}:{weapon_name}", "created_at": now,
+                 "data": {"user_id": user_id, "weapon_name": weapon_name, "quantity": quantity}}
+                for (user_id, weapon_name), quantity in sorted(inventory.items()))
+
+    # Allocated last, so the counter row stays locked only while the transaction commits
+    last_seq = _allocate(session, len(rows))
+    first_seq = last_seq - len(rows) + 1
+    for seq, row in enumerate(rows, start=first_seq):
+        row["seq"] = seq
+    session.execute(insert(ChangeLog), rows)
+    if (first_seq - 1) // PRUNE_EVERY != last_seq // PRUNE_EVERY:
+        prune_changes(session)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("changed_offers", None)
+        session.info.pop("changed_inventory", None)
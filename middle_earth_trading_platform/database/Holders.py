@@ -0,0 +1,139 @@
+# database/Holders.py
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from sqlalchemy import event, or_, and_
+
+from middle_earth_trading_platform.Configuration import holders_cache
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import Inventory
+
+
+def query_holders(session, weapon_name: str, min_quantity: int, limit: int, after=None):
+    """
+    Return up to `limit` (quantity, user_id) holders of an item, largest quantity first.
+
+    Walks the (weapon_name, quantity, user_id) index backwards from `after`, a (quantity, user_id)
+    pair returned by a previous page, so the cost depends on `limit` and not on the number of users.
+    """
+    query = session.query(Inventory.quantity, Inventory.user_id).filter(
+        Inventory.weapon_name == weapon_name, Inventory.quantity >= min_quantity)
+    if after is not None:
+        quantity, user_id = after
+        query = query.filter(or_(Inventory.quantity < quantity,
+                                 and_(Inventory.quantity == quantity, Inventory.user_id < user_id)))
+    return [(quantity, user_id) for quantity, user_id in
+            query.order_by(Inventory.quantity.desc(), Inventory.user_id.desc()).limit(limit)]
+
+
+class HoldersIndex:
+    """
+    In-memory holders of each item, kept sorted by quantity for top-K queries.
+
+    An item is loaded from the inventory table the first time it is queried and is then updated
+    from the inventory changes of every settlement committed by this process. Only enable it when a
+    single process settles offers, otherwise it misses the other processes' settlements.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # weapon_name -> ascending list of (-quantity, -user_id), i.e. largest quantity first
+        self._sorted = {}
+        # weapon_name -> {user_id: quantity}
+        self._quantities = {}
+        # weapon_name -> changes committed while the item is being loaded
+        self._loading = {}
+        self._loaded = threading.Condition(self._lock)
+
+    def top(self, weapon_name: str, min_quantity: int, limit: int, after=None):
+        """Same result as `query_holders`, served from memory."""
+        with self._lock:
+            loaded = weapon_name in self._sorted
+        if not loaded:
+            self._load(weapon_name)
+
+        with self._lock:
+            entries = self._sorted[weapon_name]
+            start = 0 if after is None else bisect_right(entries, (-after[0], -after[1]))
+            end = bisect_right(entries, (-min_quantity, float("inf")))
+            return [(-quantity, -user_id) for quantity, user_id in entries[start:min(end, start + limit)]]
+
+    def apply(self, changes):
+        """Apply committed (user_id, weapon_name, new quantity) changes to the loaded items."""
+        with self._lock:
+            self._apply(changes)
+
+    def _apply(self, changes):
+        for user_id, weapon_name, quantity in changes:
+            if weapon_name in self._loading:
+                self._loading[weapon_name].append((user_id, weapon_name, quantity))
+                continue
+            entries = self._sorted.get(weapon_name)
+            if entries is None:
+                continue
+            quantities = self._quantities[weapon_name]
+            previous = quantities.pop(user_id, None)
+            if previous is not None:
+                del entries[bisect_left(entries, (-previous, -user_id))]
+            if quantity > 0:
+                quantities[user_id] = quantity
+                insort(entries, (-quantity, -user_id))
+
+    def clear(self):
+        with self._lock:
+            self._sorted.clear()
+            self._quantities.clear()
+
+    def _load(self, weapon_name: str):
+        with self._lock:
+            # Another thread may be loading the same item
+            self._loaded.wait_for(lambda: weapon_name not in self._loading)
+            if weapon_name in self._sorted:
+                return
+            self._loading[weapon_name] = []
+
+        try:
+            session = SessionLocal()
+            try:
+                rows = session.query(Inventory.user_id, Inventory.quantity).filter(
+                    Inventory.weapon_name == weapon_name, Inventory.quantity > 0).all()
+            finally:
+                session.close()
+        except Exception:
+            with self._lock:
+                del self._loading[weapon_name]
+                self._loaded.notify_all()
+            raise
+
+        with self._lock:
+            self._quantities[weapon_name] = {user_id: quantity for user_id, quantity in rows}
+            self._sorted[weapon_name] = sorted((-quantity, -user_id) for user_id, quantity in rows)
+            # Replay settlements committed while the rows were read; they carry absolute quantities,
+            # so changes the read already saw are harmless to apply again
+            self._apply(self._loading.pop(weapon_name))
+            self._loaded.notify_all()
+
+
+def record_holder_changes(session, changes):
+    """Queue (user_id, weapon_name, new quantity) changes for the holders index until the session commits."""
+    session.info.setdefault("holder_changes", []).extend(changes)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_holder_changes(session):
+    # Also fired when a savepoint commits; the changes are only final when the outermost transaction does
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop("holder_changes", None)
+    if changes and holders_cache:
+        holders_index.apply(changes)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _discard_holder_changes(session, previous_transaction):
+    # Rolling back a savepoint keeps the changes queued by the rest of the transaction
+    if previous_transaction.parent is None:
+        session.info.pop("holder_changes", None)
+
+
+holders_index = HoldersIndex()
@@ -0,0 +1,69 @@
+# database/Migrations.py
+from sqlalchemy import Index, MetaData, Table, delete, func, inspect, select, update
+
+from middle_earth_trading_platform.database import DBSession
+from middle_earth_trading_platform.database.Backends import create_schema
+
+# Unique key the inventory upserts conflict on, and the index behind /items/{weapon_name}/holders
+INVENTORY_UNIQUE_KEY = ("user_weapon_UNIQUE", ["user_id", "weapon_name"])
+INVENTORY_INDEXES = [("ix_inventory_weapon_quantity_user", ["weapon_name", "quantity", "user_id"])]
+
+
+def merge_duplicate_inventory(connection, inventory: Table) -> int:
+    """
+    Merge inventory rows that share a (user_id, weapon_name) into the row with the lowest id.
+
+    The merged row keeps the sum of the quantities. Returns the number of rows deleted.
+    """
+    duplicates = connection.execute(
+        select(inventory.c.user_id, inventory.c.weapon_name, func.min(inventory.c.id),
+               func.coalesce(func.sum(inventory.c.quantity), 0))
+        .group_by(inventory.c.user_id, inventory.c.weapon_name)
+        .having(func.count() > 1)).all()
+
+    deleted = 0
+    for user_id, weapon_name, kept_id, quantity in duplicates:
+        connection.execute(update(inventory).where(inventory.c.id == kept_id).values(quantity=quantity))
+        deleted += connection.execute(delete(inventory).where(
+            (inventory.c.user_id == user_id) & (inventory.c.weapon_name == weapon_name) &
+            (inventory.c.id != kept_id))).rowcount
+    return deleted
+
+
+def migrate(engine=None):
+    """
+    Bring an existing database up to the current schema.
+
+    Creates the tables added since it was set up and their single-row tables' rows, merges
+    duplicate (user_id, weapon_name) inventory rows, drops the old unique index on weapon_name
+    alone if there is one, and adds the (user_id, weapon_name) unique key and the holders index. Safe to run more than once. Run
+    `rebuild_user_summaries` afterwards, since merging rows changes the distinct item counts.
+    """
+    engine = engine or DBSession.engine
+    create_schema(engine)
+
+    with engine.begin() as connection:
+        inventory = Table("inventory", MetaData(), autoload_with=connection)
+        inspector = inspect(connection)
+        unique_keys = [constraint["column_names"] for constraint in inspector.get_unique_constraints("inventory")]
+        unique_keys += [index["column_names"] for index in inspector.get_indexes("inventory") if index["unique"]]
+        index_names = {index["name"] for index in inspector.get_indexes("inventory")}
+
+        for index in list(inventory.indexes):
+            if index.unique and [column.name for column in index.columns] == ["weapon_name"]:
+                index.drop(connection)
+
+        deleted = merge_duplicate_inventory(connection, inventory)
+
+        name, columns = INVENTORY_UNIQUE_KEY
+        if columns not in unique_keys:
+            Index(name, *(inventory.c[column] for column in columns), unique=True).create(connection)
+        for name, columns in INVENTORY_INDEXES:
+            if name not in index_names:
+                Index(name, *(inventory.c[column] for column in columns)).create(connection)
+
+    return deleted
+
+
+if __name__ == "__main__":
+    print(f"Merged {migrate()} duplicate inventory rows")
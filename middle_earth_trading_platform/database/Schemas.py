@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Enum, func
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Enum, Index, UniqueConstraint, func
 
 from middle_earth_trading_platform.database.DBSession import Base
 
@@ -6,8 +6,8 @@ from middle_earth_trading_platform.database.DBSession import Base
 class User(Base):
     __tablename__ = 'user'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    username = Column(String, unique=True, index=True)
-    race = Column(String, index=True)
+    username = Column(String(255), unique=True, index=True)
+    race = Column(String(255), index=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -23,9 +23,14 @@ class User(Base):
 
 class Inventory(Base):
     __tablename__ = 'inventory'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'weapon_name', name='user_weapon_UNIQUE'),
+        # Holders of an item by quantity, for /items/{weapon_name}/holders
+        Index('ix_inventory_weapon_quantity_user', 'weapon_name', 'quantity', 'user_id'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('user.id'))
-    weapon_name = Column(String, unique=True, index=True)
+    weapon_name = Column(String(255))
     quantity = Column(Integer, index=True)
 
     def to_dict(self):
@@ -59,3 +64,96 @@ class Offers(Base):
             "created_at": str(self.created_at),
             "updated_at": str(self.updated_at),
         }
+
+
+class UserSummary(Base):
+    __tablename__ = 'user_summary'
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    total_items = Column(Integer, nullable=False, default=0)
+    distinct_items = Column(Integer, nullable=False, default=0)
+    pending_incoming = Column(Integer, nullable=False, default=0)
+    pending_outgoing = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "total_items": self.total_items,
+            "distinct_items": self.distinct_items,
+            "pending_incoming": self.pending_incoming,
+            "pending_outgoing": self.pending_outgoing,
+            "updated_at": str(self.updated_at),
+        }
+
+
+class SettlementJob(Base):
+    __tablename__ = 'settlement_jobs'
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    offer_id = Column(Integer, ForeignKey('offers.offer_id'), unique=True)
+    sender_id = Column(Integer, ForeignKey('user.id'))
+    receiver_id = Column(Integer, ForeignKey('user.id'))
+    status = Column(Enum('queued', 'running', 'done', 'failed', name='settlement_status'), index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String(255))
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "offer_id": self.offer_id,
+            "sender_id": self.sender_id,
+            "receiver_id": self.receiver_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": str(self.created_at),
+            "updated_at": str(self.updated_at),
+        }
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    key = Column(String(255), primary_key=True)
+    endpoint = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    # NULL while the first request with this key is still being processed
+    status_code = Column(Integer)
+    response = Column(JSON)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+
+class SettlementLease(Base):
+    __tablename__ = 'settlement_lease'
+    # A single row naming the process allowed to run the settlement dispatcher until expires_at
+    id = Column(Integer, primary_key=True)
+    holder = Column(String(255))
+    expires_at = Column(DateTime)
+
+
+class ChangeSequence(Base):
+    __tablename__ = 'change_sequence'
+    # A single row, locked by every transaction that writes to the change log
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+    # Changes up to this sequence number have been deleted by retention
+    pruned_through = Column(Integer, nullable=False, default=0)
+
+
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    entity = Column(String(16), nullable=False)
+    entity_key = Column(String(255), nullable=False)
+    # The row as of the change, null when it no longer exists
+    data = Column(JSON)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "entity": self.entity,
+            "key": self.entity_key,
+            "data": self.data,
+            "created_at": str(self.created_at),
+        }
@@ -0,0 +1,91 @@
+# database/Settlement.py
+from datetime import datetime
+
+from middle_earth_trading_platform.database.Backends import upsert_inventory
+from middle_earth_trading_platform.database.Changes import record_offer_change, record_inventory_changes
+from middle_earth_trading_platform.database.Holders import record_holder_changes
+from middle_earth_trading_platform.database.Schemas import Inventory
+from middle_earth_trading_platform.database.Summary import adjust_user_summary, record_inventory_change
+
+
+class SettlementError(Exception):
+    """Raised when an offer cannot be settled against the current inventories."""
+
+
+def accept_offer(session, offer):
+    """
+    Accept a pending offer and move the offered items between the two inventories.
+
+    All changes are made in the caller's session and are only persisted when the caller commits,
+    so the offer status, both inventories and both user summaries change atomically. The touched
+    inventory rows are locked with one query and updated with a single bulk upsert.
+
+    Parameters:
+    - session (Session): The session the settlement runs in.
+    - offer (Offers): The pending offer to accept.
+
+    Raises:
+    - SettlementError: If either user no longer holds an item they offered.
+    """
+    # Update offer status
+    offer.status = "accepted"
+    offer.updated_at = datetime.now()
+
+    # Net quantity change per (user_id, weapon_name)
+    deltas = {}
+    # 1. receiver items move from the receiver to the sender
+    for item, offer_qty in offer.receiver_items.items():
+        deltas[(offer.sender_id, item)] = deltas.get((offer.sender_id, item), 0) + offer_qty
+        deltas[(offer.receiver_id, item)] = deltas.get((offer.receiver_id, item), 0) - offer_qty
+    # 2. sender items move from the sender to the receiver
+    for item, offer_qty in offer.sender_items.items():
+        deltas[(offer.sender_id, item)] = deltas.get((offer.sender_id, item), 0) - offer_qty
+        deltas[(offer.receiver_id, item)] = deltas.get((offer.receiver_id, item), 0) + offer_qty
+
+    # Lock the touched rows of both users with one query
+    items = {item for _, item in deltas}
+    current = {
+        (user_id, weapon_name): quantity
+        for user_id, weapon_name, quantity in session.query(
+            Inventory.user_id, Inventory.weapon_name, Inventory.quantity).filter(
+            Inventory.user_id.in_([offer.sender_id, offer.receiver_id]),
+            Inventory.weapon_name.in_(items)).with_for_update()
+    }
+
+    for item in offer.receiver_items:
+        if (offer.receiver_id, item) not in current:
+            raise SettlementError(f"Receiver does not have {item} to barter. Please submit renewed offer.")
+    for item in offer.sender_items:
+        if (offer.sender_id, item) not in current:
+            raise SettlementError(f"Sender does not have {item} to barter. Please submit renewed offer.")
+
+    changes = [(user_id, item, delta) for (user_id, item), delta in deltas.items() if delta]
+    upsert_inventory(session, [{"user_id": user_id, "weapon_name": item, "quantity": delta}
+                               for user_id, item, delta in changes])
+
+    adjust_user_summary(session, offer.sender_id, pending_outgoing=-1)
+    adjust_user_summary(session, offer.receiver_id, pending_incoming=-1)
+    for user_id, item, delta in changes:
+        before = current.get((user_id, item)) or 0
+        record_inventory_change(session, user_id, before, before + delta)
+    record_holder_changes(session, [(user_id, item, (current.get((user_id, item)) or 0) + delta)
+                                    for user_id, item, delta in changes])
+    record_offer_change(session, offer)
+    record_inventory_changes(session, [(user_id, item, (current.get((user_id, item)) or 0) + delta)
+                                       for user_id, item, delta in changes])
+
+
+def reject_offer(session, offer):
+    """
+    Reject a pending offer in the caller's session.
+
+    Parameters:
+    - session (Session): The session the rejection runs in.
+    - offer (Offers): The pending offer to reject.
+    """
+    # Update offer status
+    offer.status = "rejected"
+    offer.updated_at = datetime.now()
+    adjust_user_summary(session, offer.sender_id, pending_outgoing=-1)
+    adjust_user_summary(session, offer.receiver_id, pending_incoming=-1)
+    record_offer_change(session, offer)
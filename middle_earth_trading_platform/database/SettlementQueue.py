@@ -0,0 +1,299 @@
+# database/SettlementQueue.py
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from middle_earth_trading_platform.Configuration import settlement_workers
+from middle_earth_trading_platform.database.Backends import begin_write
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import Offers, SettlementJob, SettlementLease
+from middle_earth_trading_platform.database.Settlement import accept_offer, SettlementError
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementQueue:
+    """
+    Durable queue of accepted offers waiting to be settled.
+
+    Jobs live in the `settlement_jobs` table. A dispatcher thread scans queued jobs in job order and
+    hands them to a worker pool so that:
+
+    - jobs touching the same user run one after another, in the order they were queued,
+    - jobs touching disjoint users run in parallel,
+    - queued jobs for the same pair of users are coalesced and settled in a single transaction.
+
+    A job is marked `done` or `failed` in the same transaction as its settlement, so a job found
+    `running` after a restart was never committed and is simply queued again.
+
+    Every process may start the queue, but only the holder of the `settlement_lease` row dispatches
+    and recovers jobs. The holder renews the lease while it runs; another process takes over once it
+    has expired for `lease_seconds`. Jobs are claimed only while still queued, and settled with their
+    job and offer rows locked, so a job claimed twice around a takeover is still settled once.
+    """
+
+    def __init__(self, workers: int = settlement_workers, batch_size: int = 50, scan_size: int = 1000,
+                 poll_interval: float = 0.5, max_attempts: int = 3, lease_seconds: float = 30.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.scan_size = scan_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # When the lease this queue holds must be renewed; None while it does not hold it
+        self._renew_at = None
+
+        self._lock = threading.Lock()
+        self._busy_users = set()
+        self._in_flight = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._executor = None
+        self._dispatcher = None
+
+    def start(self):
+        """Start the dispatcher and worker pool; interrupted jobs are requeued once the lease is acquired."""
+        if self._dispatcher is not None:
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="settlement")
+        self._dispatcher = threading.Thread(target=self._dispatch_forever, name="settlement-dispatcher",
+                                            daemon=True)
+        self._dispatcher.start()
+
+    def stop(self):
+        """Stop dispatching and wait for the running batches to finish."""
+        if self._dispatcher is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        self._dispatcher = None
+        self._executor = None
+        self.release_lease()
+
+    def hold_lease(self) -> bool:
+        """
+        Acquire or renew the dispatcher lease and return whether this queue holds it.
+
+        The lease is written at most every third of `lease_seconds`, so dispatching does not add a
+        write transaction per round.
+        """
+        now = datetime.now()
+        if self._renew_at is not None and now < self._renew_at:
+            return True
+
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            held = session.query(SettlementLease).filter(
+                SettlementLease.id == 1,
+                or_(SettlementLease.holder == self.holder, SettlementLease.holder.is_(None),
+                    SettlementLease.expires_at < now)
+            ).update({SettlementLease.holder: self.holder,
+                      SettlementLease.expires_at: now + timedelta(seconds=self.lease_seconds)},
+                     synchronize_session=False) == 1
+            session.commit()
+        finally:
+            session.close()
+
+        acquired = held and self._renew_at is None
+        self._renew_at = now + timedelta(seconds=self.lease_seconds / 3) if held else None
+        if acquired:
+            # Jobs left running were claimed by a previous holder that has stopped renewing the lease
+            self.recover()
+        return held
+
+    def release_lease(self):
+        """Give up the dispatcher lease, so another process can take over without waiting for it to expire."""
+        self._renew_at = None
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            session.query(SettlementLease).filter(SettlementLease.id == 1,
+                                                  SettlementLease.holder == self.holder).update(
+                {SettlementLease.holder: None, SettlementLease.expires_at: None}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def enqueue(self, session, offer) -> SettlementJob:
+        """
+        Add a settlement job for an offer to the caller's session.
+
+        The job becomes visible to the dispatcher once the caller commits; call `notify` afterwards
+        to have it picked up without waiting for the next poll.
+        """
+        job = SettlementJob(offer_id=offer.offer_id,
+                            sender_id=offer.sender_id,
+                            receiver_id=offer.receiver_id,
+                            status='queued',
+                            attempts=0)
+        session.add(job)
+        session.flush()
+        return job
+
+    def requeue(self, job: SettlementJob):
+        """Queue a failed job again with a fresh set of attempts; the caller commits and notifies."""
+        job.status = 'queued'
+        job.error = None
+        job.attempts = 0
+
+    def notify(self):
+        """Wake the dispatcher up."""
+        self._wakeup.set()
+
+    def recover(self):
+        """Return jobs left `running` by a previous process to the queue."""
+        session = SessionLocal()
+        try:
+            session.query(SettlementJob).filter(SettlementJob.status == 'running').update(
+                {SettlementJob.status: 'queued'}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def pending_jobs(self) -> int:
+        """Return the number of jobs that are queued or running."""
+        session = SessionLocal()
+        try:
+            return session.query(SettlementJob).filter(SettlementJob.status.in_(['queued', 'running'])).count()
+        finally:
+            session.close()
+
+    def _dispatch_forever(self):
+        while not self._stopping.is_set():
+            # Clear before scanning so a notify that races with the scan is not lost
+            self._wakeup.clear()
+            try:
+                if self.hold_lease():
+                    self._dispatch()
+            except Exception:
+                logger.exception("Settlement dispatch failed")
+            self._wakeup.wait(self.poll_interval)
+
+    def _dispatch(self):
+        with self._lock:
+            busy_users = set(self._busy_users)
+            capacity = self.workers - self._in_flight
+        if capacity <= 0:
+            return
+
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            jobs = session.query(SettlementJob).filter(SettlementJob.status == 'queued').order_by(
+                SettlementJob.job_id).limit(self.scan_size).all()
+
+            # user pair -> job ids settled together in one transaction
+            batches = {}
+            claimed = set()
+            # Users with an earlier job that cannot run in this round; their later jobs must wait too
+            blocked = set(busy_users)
+            for job in jobs:
+                users = {job.sender_id, job.receiver_id}
+                pair = (min(users), max(users))
+                if users & blocked:
+                    blocked |= users
+                elif pair in batches and len(batches[pair]) < self.batch_size:
+                    batches[pair].append(job.job_id)
+                elif pair not in batches and not users & claimed and len(batches) < capacity:
+                    batches[pair] = [job.job_id]
+                    claimed |= users
+                else:
+                    blocked |= users
+
+            if not batches:
+                return
+
+            job_ids = [job_id for batch in batches.values() for job_id in batch]
+            updated = session.query(SettlementJob).filter(
+                SettlementJob.job_id.in_(job_ids), SettlementJob.status == 'queued'
+            ).update({SettlementJob.status: 'running'}, synchronize_session=False)
+            if updated != len(job_ids):
+                # Another dispatcher claimed some of the jobs since the scan; rescan next round
+                session.rollback()
+                return
+            session.commit()
+        finally:
+            session.close()
+
+        for pair, batch in batches.items():
+            with self._lock:
+                self._busy_users.update(pair)
+                self._in_flight += 1
+            self._executor.submit(self._run_batch, pair, batch)
+
+    def _run_batch(self, pair, job_ids):
+        try:
+            self._settle_batch(job_ids)
+        except Exception as e:
+            logger.exception("Settlement of jobs %s failed", job_ids)
+            self._retry_batch(job_ids, str(e))
+        finally:
+            with self._lock:
+                self._busy_users.difference_update(pair)
+                self._in_flight -= 1
+            self._wakeup.set()
+
+    def _settle_batch(self, job_ids):
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            # Locked, so a job requeued by a lease takeover while this batch runs is settled only once
+            jobs = session.query(SettlementJob).filter(
+                SettlementJob.job_id.in_(job_ids), SettlementJob.status == 'running'
+            ).order_by(SettlementJob.job_id).with_for_update().all()
+            offers = {offer.offer_id: offer for offer in session.query(Offers).filter(
+                Offers.offer_id.in_([job.offer_id for job in jobs])
+            ).order_by(Offers.offer_id).with_for_update()}
+            for job in jobs:
+                job.attempts = job.attempts + 1
+                savepoint = session.begin_nested()
+                try:
+                    offer = offers.get(job.offer_id)
+                    if not offer or offer.status != 'pending':
+                        raise SettlementError("Offer is no longer pending")
+                    accept_offer(session, offer)
+                    session.flush()
+                    savepoint.commit()
+                    job.status = 'done'
+                except SettlementError as e:
+                    savepoint.rollback()
+                    job.status = 'failed'
+                    job.error = str(e)[:255]
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _retry_batch(self, job_ids, error: str):
+        """Put the jobs of a batch whose transaction failed back in the queue, or fail them."""
+        session = SessionLocal()
+        begin_write(session)
+        try:
+            for job in session.query(SettlementJob).filter(SettlementJob.job_id.in_(job_ids),
+                                                           SettlementJob.status == 'running').all():
+                job.attempts = job.attempts + 1
+                if job.attempts >= self.max_attempts:
+                    job.status = 'failed'
+                    job.error = error[:255]
+                else:
+                    job.status = 'queued'
+            session.commit()
+        finally:
+            session.close()
+
+
+settlement_queue = SettlementQueue()
@@ -0,0 +1,99 @@
+# database/Summary.py
+from sqlalchemy import select, insert, delete, func, case
+
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import User, Inventory, Offers, UserSummary
+
+
+def adjust_user_summary(session, user_id: int, total_items: int = 0, distinct_items: int = 0,
+                        pending_incoming: int = 0, pending_outgoing: int = 0):
+    """
+    Apply counter deltas to a user's summary row.
+
+    The update is issued as `column = column + delta` inside the caller's transaction, so the summary
+    commits or rolls back together with the offer or inventory change that caused it. A missing row
+    is created from the deltas, which is only correct for users without any history; run
+    `rebuild_user_summaries` once after deploying to seed existing users.
+    """
+    deltas = {
+        UserSummary.total_items: total_items,
+        UserSummary.distinct_items: distinct_items,
+        UserSummary.pending_incoming: pending_incoming,
+        UserSummary.pending_outgoing: pending_outgoing,
+    }
+    values = {column: column + delta for column, delta in deltas.items() if delta}
+    if not values:
+        return
+
+    updated = session.query(UserSummary).filter(UserSummary.user_id == user_id).update(
+        values, synchronize_session=False)
+    if not updated:
+        session.add(UserSummary(user_id=user_id,
+                                total_items=total_items,
+                                distinct_items=distinct_items,
+                                pending_incoming=pending_incoming,
+                                pending_outgoing=pending_outgoing))
+        # Flush right away so a second adjustment in the same transaction updates this row
+        session.flush()
+
+
+def record_inventory_change(session, user_id: int, before: int, after: int):
+    """
+    Update a user's summary for one inventory row whose quantity went from `before` to `after`.
+    """
+    before = before or 0
+    after = after or 0
+    adjust_user_summary(session, user_id,
+                        total_items=after - before,
+                        distinct_items=int(after > 0) - int(before > 0))
+
+
+def rebuild_user_summaries():
+    """
+    Recompute the summary of every user from the inventory and offers tables.
+
+    Replaces the whole `user_summary` table with a single INSERT ... SELECT over grouped aggregates,
+    so the rebuild cost is a few table scans regardless of how many users there are.
+    """
+    session = SessionLocal()
+    try:
+        inventory_totals = select(
+            Inventory.user_id.label("user_id"),
+            func.coalesce(func.sum(Inventory.quantity), 0).label("total_items"),
+            func.count(case((Inventory.quantity > 0, 1))).label("distinct_items"),
+        ).group_by(Inventory.user_id).subquery()
+
+        incoming = select(
+            Offers.receiver_id.label("user_id"),
+            func.count().label("pending"),
+        ).where(Offers.status == 'pending').group_by(Offers.receiver_id).subquery()
+
+        outgoing = select(
+            Offers.sender_id.label("user_id"),
+            func.count().label("pending"),
+        ).where(Offers.status == 'pending').group_by(Offers.sender_id).subquery()
+
+        summaries = (
+            select(
+                User.id,
+                func.coalesce(inventory_totals.c.total_items, 0),
+                func.coalesce(inventory_totals.c.distinct_items, 0),
+                func.coalesce(incoming.c.pending, 0),
+                func.coalesce(outgoing.c.pending, 0),
+            )
+            .select_from(User)
+            .outerjoin(inventory_totals, inventory_totals.c.user_id == User.id)
+            .outerjoin(incoming, incoming.c.user_id == User.id)
+            .outerjoin(outgoing, outgoing.c.user_id == User.id)
+        )
+
+        session.execute(delete(UserSummary))
+        session.execute(insert(UserSummary).from_select(
+            ["user_id", "total_items", "distinct_items", "pending_incoming", "pending_outgoing"], summaries))
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    rebuild_user_summaries()
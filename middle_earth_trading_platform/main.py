@@ -1,11 +1,32 @@
 # main.py
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 
-from middle_earth_trading_platform.routes import user_routes, offer_routes
+from middle_earth_trading_platform.Capture import traffic_capture, CaptureMiddleware
+from middle_earth_trading_platform.Configuration import settlement_mode, capture_enabled, capture_path
+from middle_earth_trading_platform.Profiling import profiler, ProfilingMiddleware
+from middle_earth_trading_platform.database.SettlementQueue import settlement_queue
+from middle_earth_trading_platform.routes import (user_routes, offer_routes, item_routes, change_routes,
+                                                  settlement_routes, admin_routes)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Drain the settlement queue in the background when accepts are settled asynchronously. Every
+    # worker process starts it, and a database lease lets one of them dispatch at a time
+    if settlement_mode == 'queued':
+        settlement_queue.start()
+    if capture_enabled:
+        traffic_capture.start(capture_path)
+    yield
+    traffic_capture.stop()
+    settlement_queue.stop()
+
 
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Include user routes
 app.include_router(user_routes.router, tags=["User"])
@@ -13,5 +34,23 @@ app.include_router(user_routes.router, tags=["User"])
 # Include offer routes
 app.include_router(offer_routes.router, tags=["Offers"])
 
+# Include item routes
+app.include_router(item_routes.router, tags=["Items"])
+
+# Include change feed routes
+app.include_router(change_routes.router, tags=["Changes"])
+
+# Include settlement routes
+app.include_router(settlement_routes.router, tags=["Settlements"])
+
+# Include admin routes
+app.include_router(admin_routes.router, tags=["Admin"])
+
+# Profile requests selected through the admin routes; a single flag check while profiling is off
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Record traffic for offline replay when capture_enabled is set
+app.add_middleware(CaptureMiddleware, capture=traffic_capture)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="localhost", port=8000)
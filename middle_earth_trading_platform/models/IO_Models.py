@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 
@@ -12,3 +14,10 @@ class CreateOffer(BaseModel):
     receiver_id: int
     sender_items: dict
     receiver_items: dict
+
+
+class ProfilingSettings(BaseModel):
+    enabled: bool
+    routes: List[str] = []
+    sample_rate: float = 1.0
+    interval_ms: float = 5.0
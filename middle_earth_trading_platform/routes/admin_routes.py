@@ -0,0 +1,116 @@
+# routes/admin_routes.py
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from middle_earth_trading_platform.Configuration import admin_enabled, admin_token
+from middle_earth_trading_platform.Profiling import profiler
+from middle_earth_trading_platform.models.IO_Models import ProfilingSettings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Guard the admin routes.
+
+    They answer 404, like an unknown path, unless `admin_enabled` is set, and when `admin_token` is
+    configured a request must carry it in the `X-Admin-Token` header.
+    """
+    if not admin_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if admin_token and not (x_admin_token and secrets.compare_digest(x_admin_token, admin_token)):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/admin/profiling")
+async def get_profiling_settings():
+    """
+    Retrieve the profiler settings and how much data it has collected.
+
+    Returns:
+    - Dict: Whether profiling is enabled, the profiled routes, sample rate and sampling interval,
+      and the number of stack samples and profiled requests collected.
+    """
+    return JSONResponse(status_code=200, content=profiler.settings())
+
+
+@router.post("/admin/profiling")
+async def update_profiling_settings(request: ProfilingSettings):
+    """
+    Switch request profiling on or off.
+
+    Parameters:
+    - enabled (bool): Whether requests are profiled.
+    - routes (List[str], optional): Route names (e.g. 'respond_to_offer') or paths
+      (e.g. '/users/respond_to_offer') to profile. Every route is profiled when empty.
+    - sample_rate (float, optional): Fraction of the matching requests to profile, between 0 and 1.
+    - interval_ms (float, optional): Stack sampling interval in milliseconds.
+
+    Returns:
+    - Dict: The updated profiler settings.
+
+    Raises:
+    - HTTPException: Returns a 400 error if the sample rate or interval is out of range.
+    """
+    if not 0 <= request.sample_rate <= 1 or request.interval_ms <= 0:
+        return JSONResponse(status_code=400, content={"error": "sample_rate must be between 0 and 1 and "
+                                                               "interval_ms must be positive"})
+    profiler.configure(request.enabled, request.routes, request.sample_rate, request.interval_ms)
+    return JSONResponse(status_code=200, content=profiler.settings())
+
+
+@router.delete("/admin/profiling")
+async def reset_profiling():
+    """
+    Discard the collected stack samples and request timings.
+
+    Returns:
+    - Dict: The profiler settings.
+    """
+    profiler.reset()
+    return JSONResponse(status_code=200, content=profiler.settings())
+
+
+@router.get("/admin/profiling/collapsed")
+async def get_collapsed_stacks():
+    """
+    Retrieve the stack samples in collapsed format.
+
+    Each line is a semicolon separated stack followed by its sample count, which flamegraph.pl,
+    speedscope and similar tools render as a flamegraph.
+
+    Returns:
+    - str: The collapsed stacks.
+    """
+    return PlainTextResponse(status_code=200, content=profiler.collapsed())
+
+
+@router.get("/admin/profiling/pstats")
+async def get_pstats():
+    """
+    Retrieve the stack samples as a pstats file.
+
+    The file can be opened with `pstats.Stats(path)` or tools such as snakeviz. Call counts are
+    sample counts and times are estimated from the sampling interval.
+
+    Returns:
+    - bytes: The marshalled pstats data.
+    """
+    return Response(status_code=200, content=profiler.pstats(), media_type="application/octet-stream",
+                    headers={"Content-Disposition": "attachment; filename=profile.pstats"})
+
+
+@router.get("/admin/profiling/spans")
+async def get_request_spans():
+    """
+    Retrieve the span timings of the recently profiled requests.
+
+    Returns:
+    - Dict: Per-route average request duration and time spent in session acquisition, query
+      execution, serialization and commit, followed by the individual profiled requests.
+    """
+    return JSONResponse(status_code=200, content=profiler.request_timings())
@@ -0,0 +1,66 @@
+# routes/change_routes.py
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+from middle_earth_trading_platform.Profiling import span
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import ChangeLog, ChangeSequence
+
+router = APIRouter()
+
+
+@router.get("/changes")
+async def get_changes(since: int = 0, limit: int = 100):
+    """
+    Retrieve the offer and inventory changes committed after a cursor.
+
+    Every committed change to an offer or inventory row gets a sequence number, in commit order, and
+    is returned with the row as it was left by the change (`data` is None when the row is gone).
+    Mirrors follow the feed by passing the `next_cursor` of each page as `since` until it reaches
+    `head`, so keeping up costs work proportional to the number of changes, not the dataset size.
+
+    Parameters:
+    - since (int, optional): Return changes with a sequence number above this cursor. Defaults to 0.
+    - limit (int, optional): Maximum number of changes to return, between 1 and 1000. Defaults to 100.
+
+    Returns:
+    - Dict: The changes in sequence order, the cursor to pass as `since` next, and `head`, the
+      sequence number of the latest change.
+
+    Raises:
+    - HTTPException: Returns a 410 error if changes after `since` have already been deleted by retention;
+                     the mirror has to re-sync from /offers/all_offers and /get_all_user_inventory and
+                     continue from the `head` it read before doing so.
+                     Returns a 400 error if `since` or `limit` is invalid, or for other exceptions
+                     encountered during processing.
+    """
+    try:
+        if since < 0:
+            raise HTTPException(status_code=400, detail="since must not be negative")
+        if not 1 <= limit <= 1000:
+            raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+
+        session = SessionLocal()
+        try:
+            sequence = session.get(ChangeSequence, 1)
+            head = sequence.last_seq if sequence else 0
+            pruned_through = sequence.pruned_through if sequence else 0
+            if since < pruned_through:
+                raise HTTPException(status_code=410, detail=f"Changes up to {pruned_through} are no longer "
+                                                            f"retained, re-sync and continue from the head")
+            changes = session.query(ChangeLog).filter(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(
+                limit).all()
+        finally:
+            session.close()
+
+        with span("serialization"):
+            return JSONResponse(status_code=200, content={
+                "changes": [change.to_dict() for change in changes],
+                "next_cursor": changes[-1].seq if changes else since,
+                "head": max(head, changes[-1].seq) if changes else head,
+            })
+
+    except HTTPException as http_exc:
+        return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
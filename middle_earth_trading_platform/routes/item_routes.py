@@ -0,0 +1,72 @@
+# routes/item_routes.py
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+from middle_earth_trading_platform.Configuration import holders_cache
+from middle_earth_trading_platform.Profiling import span
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Holders import holders_index, query_holders
+
+router = APIRouter()
+
+
+@router.get("/items/{weapon_name}/holders")
+async def get_item_holders(weapon_name: str, min_quantity: int = 1, limit: int = 50, cursor: str = None):
+    """
+    Retrieve the users holding an item, largest quantity first.
+
+    Uses the (weapon_name, quantity, user_id) index on the inventory table, or the in-memory holders
+    index when `holders_cache` is enabled, so a page costs the same however many users there are.
+
+    Parameters:
+    - weapon_name (str): The item to find holders of.
+    - min_quantity (int, optional): Only return users holding at least this many, at least 1. Defaults to 1.
+    - limit (int, optional): Maximum number of holders to return, between 1 and 1000. Defaults to 50.
+    - cursor (str, optional): The `next_cursor` of the previous page.
+
+    Returns:
+    - Dict: The holders as a list of user IDs and quantities, and the cursor of the next page, which
+      is None on the last page.
+
+    Raises:
+    - HTTPException: Returns a 400 error if min_quantity, the limit or the cursor is invalid, or if any
+      other exception occurs during processing.
+    """
+    try:
+        if min_quantity < 1:
+            raise HTTPException(status_code=400, detail="min_quantity must be at least 1")
+        if not 1 <= limit <= 1000:
+            raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+
+        after = None
+        if cursor:
+            try:
+                quantity, user_id = cursor.split(":")
+                after = (int(quantity), int(user_id))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        # Fetch one extra holder to know whether there is a next page
+        if holders_cache:
+            holders = holders_index.top(weapon_name, min_quantity, limit + 1, after)
+        else:
+            session = SessionLocal()
+            holders = query_holders(session, weapon_name, min_quantity, limit + 1, after)
+            session.close()
+
+        next_cursor = None
+        if len(holders) > limit:
+            holders = holders[:limit]
+            next_cursor = f"{holders[-1][0]}:{holders[-1][1]}"
+
+        with span("serialization"):
+            return JSONResponse(status_code=200, content={
+                "weapon_name": weapon_name,
+                "holders": [{"user_id": user_id, "quantity": quantity} for quantity, user_id in holders],
+                "next_cursor": next_cursor,
+            })
+
+    except HTTPException as http_exc:
+        return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
@@ -1,11 +1,17 @@
 # routes/offer_routes.py
 from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import JSONResponse
 
+from middle_earth_trading_platform.Idempotency import idempotency_store
+from middle_earth_trading_platform.Profiling import span
+from middle_earth_trading_platform.database.Backends import begin_write
+from middle_earth_trading_platform.database.Changes import record_offer_change
 from middle_earth_trading_platform.database.DBSession import SessionLocal
 from middle_earth_trading_platform.database.Schemas import User, Inventory, Offers
+from middle_earth_trading_platform.database.Summary import adjust_user_summary
 from middle_earth_trading_platform.models.IO_Models import CreateOffer
 
 router = APIRouter()
@@ -22,7 +28,7 @@ router = APIRouter()
 
 @router.post("/offers/create_offer")
 # async def create_offer(user_id: int, sender_items: dict, receiver_id: int, receiver_items: dict):
-async def create_offer(request: CreateOffer):
+async def create_offer(request: CreateOffer, idempotency_key: Optional[str] = Header(None)):
     """
     Create a new offer between two users.
 
@@ -34,16 +40,29 @@ async def create_offer(request: CreateOffer):
     - sender_items (dict): A dictionary containing items offered by the sender and their quantities.
     - receiver_id (int): The ID of the user who will receive the offer.
     - receiver_items (dict): A dictionary containing items requested by the receiver and their quantities.
+    - Idempotency-Key (header, optional): A client-chosen key that makes retries safe. Repeating a
+      request with the same key returns the stored response of the first successful attempt
+      without running it again.
 
     Returns:
-    - JSONResponse: A JSON response indicating the success or failure of the offer creation.
+    - JSONResponse: A JSON response indicating the success or failure of the offer creation, with the
+      ID of the new offer on success.
 
     Raises:
     - HTTPException: Returns a 404 error if the sender or receiver is not found.
                      Returns a 400 error if the sender or receiver lacks the required items or if any other exception occurs during processing.
+                     Returns a 409 error if a request with the same Idempotency-Key is still in progress, and a
+                     422 error if the key was already used with a different request.
     """
+    return await idempotency_store.run(idempotency_key, "create_offer", request.model_dump(),
+                                       lambda: _create_offer(request))
+
+
+async def _create_offer(request: CreateOffer):
+    """Validate and store a new offer; see `create_offer`."""
+    session = SessionLocal()
     try:
-        session = SessionLocal()
+        begin_write(session)
         sender = session.query(User).filter(User.id == request.user_id).first()
         receiver = session.query(User).filter(User.id == request.receiver_id).first()
         if not sender or not receiver:
@@ -79,10 +98,15 @@ async def create_offer(request: CreateOffer):
                            updated_at=datetime.now())
 
         session.add(new_offer)
+        session.flush()
+        offer_id = new_offer.offer_id
+        adjust_user_summary(session, request.user_id, pending_outgoing=1)
+        adjust_user_summary(session, request.receiver_id, pending_incoming=1)
+        record_offer_change(session, new_offer)
         session.commit()
         session.close()
 
-        return JSONResponse(status_code=200, content={"data": "success"})
+        return JSONResponse(status_code=200, content={"data": "success", "offer_id": offer_id})
 
     except HTTPException as http_exc:
         return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
@@ -90,6 +114,10 @@ async def create_offer(request: CreateOffer):
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
 
+    finally:
+        # Release the write transaction on validation errors too
+        session.close()
+
 
 @router.get("/offers/all_offers")
 async def get_all_offers(sender_id: int = None, receiver_id: int = None, status: str = None):
@@ -123,8 +151,9 @@ async def get_all_offers(sender_id: int = None, receiver_id: int = None, status:
 
         offers = query.all()
 
-        offers = [offer.to_dict() for offer in offers]
-        return JSONResponse(status_code=200, content=offers)
+        with span("serialization"):
+            offers = [offer.to_dict() for offer in offers]
+            return JSONResponse(status_code=200, content=offers)
 
     except HTTPException as http_exc:
         return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
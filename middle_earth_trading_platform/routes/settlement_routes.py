@@ -0,0 +1,40 @@
+# routes/settlement_routes.py
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Schemas import SettlementJob
+
+router = APIRouter()
+
+
+@router.get("/settlements/{job_id}")
+async def get_settlement(job_id: int):
+    """
+    Retrieve the status of a queued settlement.
+
+    Accepting an offer while `settlement_mode` is 'queued' returns the URL of this endpoint, which
+    reports whether the settlement is still queued or running, done, or failed.
+
+    Parameters:
+    - job_id (int): The ID of the settlement job.
+
+    Returns:
+    - Dict[str, Union[int, str]]: The settlement job, including its status and, if it failed, the error.
+
+    Raises:
+    - HTTPException: Returns a 404 error if the settlement job is not found.
+                     Returns a 400 error for other exceptions encountered during processing.
+    """
+    try:
+        session = SessionLocal()
+        job = session.get(SettlementJob, job_id)
+        session.close()
+        if not job:
+            raise HTTPException(status_code=404, detail="Settlement not found")
+        return JSONResponse(status_code=200, content=job.to_dict())
+
+    except HTTPException as http_exc:
+        return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
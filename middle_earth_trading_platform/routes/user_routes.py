@@ -1,9 +1,17 @@
 # routes/user_routes.py
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import JSONResponse
 
+from middle_earth_trading_platform.Configuration import settlement_mode
+from middle_earth_trading_platform.Idempotency import idempotency_store
+from middle_earth_trading_platform.Profiling import span
+from middle_earth_trading_platform.database.Backends import begin_write
 from middle_earth_trading_platform.database.DBSession import SessionLocal
-from middle_earth_trading_platform.database.Schemas import User, Inventory, Offers
+from middle_earth_trading_platform.database.Schemas import User, Inventory, Offers, UserSummary, SettlementJob
+from middle_earth_trading_platform.database.Settlement import accept_offer, reject_offer, SettlementError
+from middle_earth_trading_platform.database.SettlementQueue import settlement_queue
 from middle_earth_trading_platform.models.IO_Models import RespondToOffer
 
 router = APIRouter()
@@ -26,9 +34,11 @@ async def get_all_user_details():
 
         session = SessionLocal()
         users = session.query(User).all()
-        users = [user.to_dict() for user in users]
+        with span("serialization"):
+            users = [user.to_dict() for user in users]
         session.close()
-        return JSONResponse(status_code=200, content=users)
+        with span("serialization"):
+            return JSONResponse(status_code=200, content=users)
 
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
@@ -56,11 +66,13 @@ async def get_all_user_inventory():
         users = session.query(User).all()
         for user in users:
             inventory_details = session.query(Inventory).filter(Inventory.user_id == user.id).all()
-            inventory_details = [i.to_dict() for i in inventory_details]
+            with span("serialization"):
+                inventory_details = [i.to_dict() for i in inventory_details]
             users_inventory[user.id] = {"username": user.username, "inventory": inventory_details}
         session.close()
 
-        return JSONResponse(status_code=200, content=users_inventory)
+        with span("serialization"):
+            return JSONResponse(status_code=200, content=users_inventory)
 
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
@@ -126,8 +138,9 @@ async def get_user_inventory(user_id: int):
                 raise HTTPException(status_code=404, detail="User not found")
             else:
                 raise HTTPException(status_code=404, detail="Inventory details not found for the user")
-        inventory_details = [i.to_dict() for i in inventory_details]
-        return JSONResponse(status_code=200, content=inventory_details)
+        with span("serialization"):
+            inventory_details = [i.to_dict() for i in inventory_details]
+            return JSONResponse(status_code=200, content=inventory_details)
 
     except HTTPException as http_exc:
         return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
@@ -160,9 +173,9 @@ async def get_user_offers(user_id: int):
             raise HTTPException(status_code=404, detail="User not found")
 
         offers = session.query(Offers).filter(Offers.receiver_id == user_id).all()
-        offers = [offer.to_dict() for offer in offers]
-
-        return JSONResponse(status_code=200, content=offers)
+        with span("serialization"):
+            offers = [offer.to_dict() for offer in offers]
+            return JSONResponse(status_code=200, content=offers)
 
     except HTTPException as http_exc:
         return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
@@ -171,8 +184,41 @@ async def get_user_offers(user_id: int):
         return JSONResponse(status_code=400, content={"error": str(e)})
 
 
+@router.get("/users/{user_id}/summary")
+async def get_user_summary(user_id: int):
+    """
+    Retrieve the trading summary of a specific user.
+
+    Returns item totals and pending offer counts from the `user_summary` table, which is kept up to
+    date by offer creation and responses, so the lookup cost does not grow with the user's history.
+
+    Parameters:
+    - user_id (int): The unique identifier of the user.
+
+    Returns:
+    - Dict[str, Union[int, str]]: The user's total item quantity, distinct item count, and the number
+      of pending incoming and outgoing offers.
+
+    Raises:
+    - HTTPException: Returns a 404 error if no summary exists for the specified user.
+    - HTTPException: Returns a 400 error if an exception occurs during processing.
+    """
+    try:
+        session = SessionLocal()
+        summary = session.get(UserSummary, user_id)
+        session.close()
+        if not summary:
+            raise HTTPException(status_code=404, detail="Summary not found for the user")
+        return JSONResponse(status_code=200, content=summary.to_dict())
+
+    except HTTPException as http_exc:
+        return JSONResponse(status_code=http_exc.status_code, content={"error": http_exc.detail})
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+
 @router.post("/users/respond_to_offer")
-async def respond_to_offer(request: RespondToOffer):
+async def respond_to_offer(request: RespondToOffer, idempotency_key: Optional[str] = Header(None)):
     """
     Respond to an offer with acceptance or rejection.
 
@@ -184,19 +230,35 @@ async def respond_to_offer(request: RespondToOffer):
     - user_id (int): The ID of the user responding to the offer.
     - offer_id (int): The ID of the offer being responded to.
     - response (str): The response to the offer, which must be either 'accept' or 'reject'.
+    - Idempotency-Key (header, optional): A client-chosen key that makes retries safe. Repeating a
+      request with the same key returns the stored response of the first successful attempt
+      without running it again.
 
     Returns:
-    - JSONResponse: A JSON response indicating the success or failure of the operation.
+    - JSONResponse: A JSON response indicating the success or failure of the operation. When
+      `settlement_mode` is 'queued', an acceptance returns 202 with the settlement job ID and a
+      status URL instead of settling inline. Accepting an offer whose settlement failed queues
+      its job again.
 
     Raises:
     - HTTPException: Returns a 401 error if the User is unauthorized to perform this action.
     - HTTPException: Returns a 404 error if the User or the offer is not found.
     - HTTPException: Returns a 400 error if the response is not 'accept' or 'reject', or if any
       other exception occurs during processing.
+    - HTTPException: Returns a 409 error if the offer's acceptance is already queued for settlement
+      and the response is not 'accept'.
+    - HTTPException: Returns a 409 error if a request with the same Idempotency-Key is still in
+      progress, and a 422 error if the key was already used with a different request.
     """
-    try:
+    return await idempotency_store.run(idempotency_key, "respond_to_offer", request.model_dump(),
+                                       lambda: _respond_to_offer(request))
 
-        session = SessionLocal()
+
+async def _respond_to_offer(request: RespondToOffer):
+    """Apply a response to an offer; see `respond_to_offer`."""
+    session = SessionLocal()
+    try:
+        begin_write(session)
         sender = session.query(User).filter(User.id == request.user_id).first()
         if not sender:
             raise HTTPException(status_code=404, detail="User not found")
@@ -214,58 +276,39 @@ async def respond_to_offer(request: RespondToOffer):
         if request.response.lower() not in ['accept', 'reject']:
             raise HTTPException(status_code=400, detail="Invalid response. Must be 'accept' or 'reject'")
 
+        # A queued accept leaves the offer pending until it is settled; it must not be overturned meanwhile
+        job = session.query(SettlementJob).filter(SettlementJob.offer_id == offer.offer_id).first()
+        if job and job.status in ('queued', 'running') and request.response.lower() != 'accept':
+            raise HTTPException(status_code=409, detail="Offer is already accepted and queued for settlement")
+
         if request.response.lower() == 'accept':
-            # Update offer status
-            offer.status = "accepted"
-
-            # Update inventories for both sender and receiver
-            # 1. receiver items
-            for item, offer_qty in offer.receiver_items.items():
-                # add to senders inventory
-                sender_inventory = session.query(Inventory).filter(
-                    (Inventory.user_id == offer.sender_id) & (Inventory.weapon_name == item)).first()
-                if sender_inventory:
-                    sender_inventory.quantity = sender_inventory.quantity + offer_qty
-                else:
-                    new_inventory = Inventory(user_id=offer.sender_id, weapon_name=item, quantity=offer_qty)
-                    session.add(new_inventory)
-
-                # remove from receiver's inventory
-                receiver_inventory = session.query(Inventory).filter(
-                    (Inventory.user_id == offer.receiver_id) & (Inventory.weapon_name == item)).first()
-                if receiver_inventory:
-                    receiver_inventory.quantity = receiver_inventory.quantity - offer_qty
-                else:
-                    raise HTTPException(status_code=400, detail=f"Receiver does not have {item} to barter. "
-                                                                f"Please submit renewed offer.")
-
-            # 2. sender items
-            for item, offer_qty in offer.sender_items.items():
-                # add to senders inventory
-                sender_inventory = session.query(Inventory).filter(
-                    (Inventory.user_id == offer.sender_id) & (Inventory.weapon_name == item)).first()
-                if sender_inventory:
-                    sender_inventory.quantity = sender_inventory.quantity - offer_qty
-                else:
-                    raise HTTPException(status_code=400, detail=f"Sender does not have {item} to barter. "
-                                                                f"Please submit renewed offer.")
-
-                # remove from receiver's inventory
-                receiver_inventory = session.query(Inventory).filter(
-                    (Inventory.user_id == offer.receiver_id) & (Inventory.weapon_name == item)).first()
-                if receiver_inventory:
-                    receiver_inventory.quantity = receiver_inventory.quantity + offer_qty
-                else:
-                    new_inventory = Inventory(user_id=offer.receiver_id, weapon_name=item, quantity=offer_qty)
-                    session.add(new_inventory)
+            if settlement_mode == 'queued':
+                # Settle in the background; a repeated accept returns the job already queued and
+                # retries a failed one
+                if not job or job.status == 'failed':
+                    if job:
+                        settlement_queue.requeue(job)
+                    else:
+                        job = settlement_queue.enqueue(session, offer)
+                    session.commit()
+                    settlement_queue.notify()
+                content = {"data": "Offer queued for settlement",
+                           "job_id": job.job_id,
+                           "status_url": f"/settlements/{job.job_id}"}
+                session.close()
+                return JSONResponse(status_code=202, content=content)
+
+            try:
+                accept_offer(session, offer)
+            except SettlementError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
             session.commit()
             session.close()
 
             return JSONResponse(status_code=200, content={"data": "Offer accepted successfully"})
         else:
-            # Update offer status
-            offer.status = "rejected"
+            reject_offer(session, offer)
             session.commit()
             session.close()
             return JSONResponse(status_code=200, content={"data": "Offer rejected successfully"})
@@ -275,3 +318,7 @@ async def respond_to_offer(request: RespondToOffer):
 
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
+
+    finally:
+        # Release the write transaction on validation errors too
+        session.close()
@@ -1,3 +1,26 @@
+import asyncio
+import json
+import marshal
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from middle_earth_trading_platform.Capture import traffic_capture, read_capture
+from middle_earth_trading_platform.Idempotency import IdempotencyStore
+from middle_earth_trading_platform.Profiling import Profiler
+from middle_earth_trading_platform.database.Backends import create_backend_engine, upsert_inventory
+from middle_earth_trading_platform.database.DBSession import SessionLocal
+from middle_earth_trading_platform.database.Migrations import migrate
+from middle_earth_trading_platform.database.Schemas import IdempotencyKey, SettlementJob
+from middle_earth_trading_platform.database.SettlementQueue import SettlementQueue
+from middle_earth_trading_platform.database.Summary import rebuild_user_summaries
+from middle_earth_trading_platform.routes import admin_routes, user_routes
+
+
 def test_get_user_positive(client):
     user_id = 1
 
@@ -49,6 +72,48 @@ def test_get_user_inventory_user_inventory_not_found(client):
     assert response.status_code == 404
 
 
+def test_get_user_summary_success(client):
+    user_id = 1
+
+    # Send a GET request to the endpoint
+    response = client.get(f"/users/{user_id}/summary")
+
+    # Assert that the response status code is 200 (OK)
+    assert response.status_code == 200
+    assert set(response.json()) >= {"total_items", "distinct_items", "pending_incoming", "pending_outgoing"}
+
+
+def test_user_summary_follows_offers(client):
+    def counters(user_id):
+        summary = client.get(f"/users/{user_id}/summary").json()
+        return {key: summary[key] for key in ("total_items", "distinct_items", "pending_incoming", "pending_outgoing")}
+
+    sender_before, receiver_before = counters(1), counters(2)
+    offer_id = client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1},
+                                                         "receiver_id": 2, "receiver_items": {"sword": 1}}
+                           ).json()["offer_id"]
+    assert counters(1) == {**sender_before, "pending_outgoing": sender_before["pending_outgoing"] + 1}
+    assert counters(2) == {**receiver_before, "pending_incoming": receiver_before["pending_incoming"] + 1}
+
+    client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "reject"})
+    incremental = counters(1), counters(2)
+    assert incremental == (sender_before, receiver_before)
+
+    # Rebuilding from the inventory and offers tables gives the incrementally maintained values
+    rebuild_user_summaries()
+    assert (counters(1), counters(2)) == incremental
+
+
+def test_get_user_summary_not_found(client):
+    user_id = 10000000
+
+    # Send a GET request to the endpoint
+    response = client.get(f"/users/{user_id}/summary")
+
+    # Assert that the response status code is 404
+    assert response.status_code == 404
+
+
 def test_create_offer(client):
     user_id = 1
     receiver_id = 2
@@ -70,7 +135,8 @@ def test_create_offer(client):
     assert response.status_code == 200
 
     # Optionally, you can also assert the response content if needed
-    assert response.json() == {"data": "success"}
+    assert response.json()["data"] == "success"
+    assert isinstance(response.json()["offer_id"], int)
 
 
 def test_create_offer_error_cases(client):
@@ -152,3 +218,319 @@ def test_get_user_offers_success(client):
 def test_get_all_offers_success(client):
     response = client.get("/offers/all_offers")
     assert response.status_code == 200
+
+
+def test_accept_offer_moves_inventory(client):
+    def quantities(user_id):
+        items = client.get(f"/users/{user_id}/user_inventory").json()
+        return [(item["weapon_name"], int(item["quantity"])) for item in items]
+
+    sender_before, receiver_before = dict(quantities(1)), dict(quantities(2))
+    offer_id = client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1},
+                                                         "receiver_id": 2, "receiver_items": {"sword": 1}}
+                           ).json()["offer_id"]
+    response = client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "accept"})
+    assert response.status_code == 200
+
+    try:
+        # The upsert adds to the existing rows, or creates one, instead of inserting duplicates
+        sender_after, receiver_after = quantities(1), quantities(2)
+        assert len(sender_after) == len(dict(sender_after))
+        assert len(receiver_after) == len(dict(receiver_after))
+        assert dict(sender_after)["staff"] == sender_before["staff"] - 1
+        assert dict(sender_after)["sword"] == sender_before.get("sword", 0) + 1
+        assert dict(receiver_after)["staff"] == receiver_before.get("staff", 0) + 1
+        assert dict(receiver_after)["sword"] == receiver_before["sword"] - 1
+    finally:
+        # Trade the items back, so the seed inventory does not run out over repeated runs
+        offer_id = client.post("/offers/create_offer", json={"user_id": 2, "sender_items": {"staff": 1},
+                                                             "receiver_id": 1, "receiver_items": {"sword": 1}}
+                               ).json()["offer_id"]
+        client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 1, "response": "accept"})
+
+    assert dict(quantities(1))["staff"] == sender_before["staff"]
+    assert dict(quantities(2))["sword"] == receiver_before["sword"]
+
+
+def test_migrate_merges_duplicate_inventory(tmp_path):
+    engine = create_backend_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        # The inventory table as databases created before the (user_id, weapon_name) unique key have it
+        connection.execute(text("CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(255), "
+                                "race VARCHAR(255), created_at DATETIME, updated_at DATETIME)"))
+        connection.execute(text("CREATE TABLE inventory (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES user(id), "
+                                "weapon_name VARCHAR(255), quantity INTEGER)"))
+        connection.execute(text("INSERT INTO user (id, username, race) VALUES (1, 'frodo', 'hobbit')"))
+        connection.execute(text("INSERT INTO inventory (user_id, weapon_name, quantity) "
+                                "VALUES (1, 'sword', 2), (1, 'sword', 3), (1, 'bow', 1)"))
+
+    assert migrate(engine) == 1
+    assert migrate(engine) == 0
+    assert "ix_inventory_weapon_quantity_user" in {index["name"] for index in inspect(engine).get_indexes("inventory")}
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT last_seq FROM change_sequence WHERE id = 1")).scalar() == 0
+
+    with Session(engine) as session:
+        upsert_inventory(session, [{"user_id": 1, "weapon_name": "sword", "quantity": -1}])
+        session.commit()
+        rows = session.execute(text("SELECT weapon_name, quantity FROM inventory ORDER BY weapon_name")).all()
+    assert rows == [("bow", 1), ("sword", 4)]
+
+
+def test_get_settlement_not_found(client):
+    job_id = 10000000
+
+    # Send a GET request to the endpoint
+    response = client.get(f"/settlements/{job_id}")
+
+    # Assert that the response status code is 404
+    assert response.status_code == 404
+
+
+def _discard_settlement(offer_id):
+    """Delete the settlement job of an offer the queue never ran, so the offer can be rejected again."""
+    session = SessionLocal()
+    try:
+        session.query(SettlementJob).filter(SettlementJob.offer_id == offer_id).delete()
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_queued_accept_cannot_be_rejected(client, monkeypatch):
+    # The settlement queue is not running, so the accepted offer stays queued
+    monkeypatch.setattr(user_routes, "settlement_mode", "queued")
+    offer_id = client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1},
+                                                         "receiver_id": 2, "receiver_items": {"sword": 1}}
+                           ).json()["offer_id"]
+
+    response = client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "accept"})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    try:
+        response = client.post("/users/respond_to_offer",
+                               json={"offer_id": offer_id, "user_id": 2, "response": "reject"})
+        assert response.status_code == 409
+        assert client.get(f"/settlements/{job_id}").json()["status"] == "queued"
+
+        # Repeating the accept returns the same job
+        response = client.post("/users/respond_to_offer",
+                               json={"offer_id": offer_id, "user_id": 2, "response": "accept"})
+        assert response.json()["job_id"] == job_id
+    finally:
+        _discard_settlement(offer_id)
+        client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "reject"})
+
+
+def test_failed_settlement_can_be_accepted_again(client, monkeypatch):
+    monkeypatch.setattr(user_routes, "settlement_mode", "queued")
+    offer_id = client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1},
+                                                         "receiver_id": 2, "receiver_items": {"sword": 1}}
+                           ).json()["offer_id"]
+    response = client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "accept"})
+    job_id = response.json()["job_id"]
+
+    try:
+        # As the queue leaves a job whose settlement failed, e.g. because an item ran out
+        session = SessionLocal()
+        session.query(SettlementJob).filter(SettlementJob.job_id == job_id).update(
+            {SettlementJob.status: "failed", SettlementJob.error: "Insufficient items", SettlementJob.attempts: 1})
+        session.commit()
+        session.close()
+
+        response = client.post("/users/respond_to_offer",
+                               json={"offer_id": offer_id, "user_id": 2, "response": "accept"})
+        assert response.status_code == 202
+        assert response.json()["job_id"] == job_id
+        job = client.get(f"/settlements/{job_id}").json()
+        assert job["status"] == "queued"
+        assert job["error"] is None
+        assert job["attempts"] == 0
+    finally:
+        _discard_settlement(offer_id)
+        client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "reject"})
+
+
+def test_settlement_lease_has_one_holder(client):
+    first, second = SettlementQueue(), SettlementQueue()
+    try:
+        assert first.hold_lease()
+        assert not second.hold_lease()
+
+        # Releasing the lease hands it over without waiting for it to expire
+        first.release_lease()
+        assert second.hold_lease()
+        assert not first.hold_lease()
+    finally:
+        first.release_lease()
+        second.release_lease()
+
+
+def test_admin_routes_disabled_by_default(client):
+    response = client.post("/admin/profiling", json={"enabled": True})
+    assert response.status_code == 404
+    assert client.get("/admin/profiling/pstats").status_code == 404
+
+
+def test_profiling_collects_spans(client, monkeypatch):
+    monkeypatch.setattr(admin_routes, "admin_enabled", True)
+    # Profile only the inventory listing, then switch profiling off again
+    response = client.post("/admin/profiling", json={"enabled": True, "routes": ["get_all_user_inventory"]})
+    assert response.status_code == 200
+
+    client.get("/get_all_user_inventory")
+    client.get("/users/1")
+
+    spans = client.get("/admin/profiling/spans").json()
+    client.post("/admin/profiling", json={"enabled": False})
+    client.delete("/admin/profiling")
+
+    assert list(spans["routes"]) == ["get_all_user_inventory"]
+    assert "query" in spans["routes"]["get_all_user_inventory"]["spans"]
+
+
+def test_profiler_samples_only_running_profiled_requests():
+    profiler = Profiler()
+    resumed = asyncio.Event()
+
+    async def profiled_request():
+        profile = profiler.start_request("get_user", sys._getframe())
+        # Suspended, like a handler awaiting I/O, while another request runs on the event loop
+        await resumed.wait()
+        profiler.sample()
+        profiler.finish_request(profile, 0.0)
+
+    async def unprofiled_request():
+        profiler.sample()
+        resumed.set()
+
+    async def main():
+        await asyncio.gather(profiled_request(), unprofiled_request())
+        # Idle again once the profiled request has finished
+        profiler.sample()
+
+    asyncio.run(main())
+
+    lines = profiler.collapsed().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith("get_user;")
+    assert lines[0].endswith("Profiling.py:sample 1")
+    assert ("<route>", 0, "get_user") in marshal.loads(profiler.pstats())
+
+
+def test_create_offer_idempotency_key(client):
+    body = {
+        "user_id": 1,
+        "sender_items": {"staff": 1},
+        "receiver_id": 2,
+        "receiver_items": {"sword": 1}
+    }
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    offers_before = len(client.get("/offers/all_offers", params={"sender_id": 1}).json())
+
+    # Retrying with the same key replays the first response without creating a second offer
+    first = client.post("/offers/create_offer", json=body, headers=headers)
+    retry = client.post("/offers/create_offer", json=body, headers=headers)
+    offers_after = len(client.get("/offers/all_offers", params={"sender_id": 1}).json())
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert offers_after == offers_before + 1
+
+    # Reusing the key for a different request is rejected
+    response = client.post("/offers/create_offer", json={**body, "sender_items": {"staff": 2}}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_idempotency_store_prunes_expired_keys(client):
+    expired_key = str(uuid.uuid4())
+    session = SessionLocal()
+    session.add(IdempotencyKey(key=expired_key, endpoint="test", request_hash="0" * 64, status_code=200,
+                               response={}, created_at=datetime.now() - timedelta(days=2)))
+    session.commit()
+    session.close()
+
+    async def handler():
+        return JSONResponse(status_code=200, content={"data": "success"})
+
+    # Storing a response prunes the table once every prune_every responses
+    store = IdempotencyStore(ttl_seconds=86400, prune_every=1)
+    asyncio.run(store.run(str(uuid.uuid4()), "test", {}, handler))
+
+    session = SessionLocal()
+    assert session.get(IdempotencyKey, (expired_key, "test")) is None
+    session.close()
+
+
+def test_item_holders_pagination(client):
+    response = client.get("/items/staff/holders")
+    assert response.status_code == 200
+    holders = response.json()["holders"]
+    assert holders
+    assert [holder["quantity"] for holder in holders] == sorted((holder["quantity"] for holder in holders),
+                                                                reverse=True)
+
+    # Walking the pages one holder at a time returns the same holders
+    pages, cursor = [], None
+    while True:
+        page = client.get("/items/staff/holders", params={"limit": 1, "cursor": cursor}).json()
+        pages.extend(page["holders"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == holders
+
+
+def test_item_holders_invalid_cursor(client):
+    response = client.get("/items/staff/holders", params={"cursor": "bad"})
+    assert response.status_code == 400
+
+
+def test_item_holders_invalid_min_quantity(client):
+    # Users left with none of the item are not holders, whichever path serves the request
+    response = client.get("/items/staff/holders", params={"min_quantity": 0})
+    assert response.status_code == 400
+
+
+def test_traffic_capture(client, tmp_path):
+    capture_file = str(tmp_path / "traffic.jsonl")
+    traffic_capture.start(capture_file)
+    client.get("/users/1/summary")
+    client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1}, "receiver_id": 2,
+                                              "receiver_items": {"sword": 1}}, headers={"Idempotency-Key": "retry-1"})
+    client.get("/admin/profiling")
+    traffic_capture.stop()
+
+    records = list(read_capture(capture_file))
+    assert [(record["method"], record["route"]) for record in records] == [
+        ("GET", "/users/{user_id}/summary"), ("POST", "/offers/create_offer")]
+    assert records[0]["params"] == {"user_id": "1"}
+    assert json.loads(records[1]["body"])["sender_items"] == {"staff": 1}
+    assert "offer_id" in json.loads(records[1]["response"])
+    assert records[1]["idempotency_key"] == "retry-1"
+
+
+def test_change_feed_follows_offers(client):
+    head = client.get("/changes", params={"limit": 1}).json()["head"]
+    response = client.post("/offers/create_offer", json={"user_id": 1, "sender_items": {"staff": 1},
+                                                         "receiver_id": 2, "receiver_items": {"sword": 1}})
+    offer_id = response.json()["offer_id"]
+    client.post("/users/respond_to_offer", json={"offer_id": offer_id, "user_id": 2, "response": "reject"})
+
+    response = client.get("/changes", params={"since": head})
+    assert response.status_code == 200
+    feed = response.json()
+    assert [(change["entity"], change["key"], change["data"]["status"]) for change in feed["changes"]] == [
+        ("offers", str(offer_id), "pending"), ("offers", str(offer_id), "rejected")]
+    assert feed["next_cursor"] == feed["head"] == head + 2
+
+    # Nothing new after the last change
+    assert client.get("/changes", params={"since": feed["next_cursor"]}).json()["changes"] == []
+
+
+def test_change_feed_invalid_limit(client):
+    response = client.get("/changes", params={"limit": 0})
+    assert response.status_code == 400